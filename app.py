@@ -8,15 +8,36 @@ Uses Sentence Transformers for retrieval and Mistral for generating responses.
 
 import os
 import json
+import hashlib
+import time
+import mmap
+import queue
+import threading
+from concurrent.futures import Future
 import numpy as np
 import faiss
 import re
-from flask import Flask, request, jsonify, render_template, send_from_directory
-import markdown
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Prefer the single-pass mistune renderer over the regex-heavy markdown library
+try:
+    import mistune
+    render_markdown = mistune.create_markdown(escape=False, plugins=["strikethrough", "table"])
+except ImportError:
+    import markdown
+    render_markdown = markdown.markdown
 
 # Import the LLM helper
 from llm_helper import MistralLLM
-from code_formatter import CodeFormattingLLM  # Import your existing CodeFormattingLLM
+from code_formatter import CodeFormattingLLM, format_code_blocks  # Import your existing CodeFormattingLLM
+from lru_cache import LRUCache
+from result_pruning import prune_results
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Main folder containing app.py
@@ -24,12 +45,141 @@ VECTOR_DB_DIR = os.path.join(BASE_DIR, "vector_db")
 PROCESSED_DIR = os.path.join(BASE_DIR, "processed_data")
 MODELS_DIR = os.path.join(BASE_DIR, "models")  # For storing models
 TOP_K = 5  # Number of most relevant chunks to retrieve
+EMBEDDING_MAX_SEQ_LENGTH = 256  # Tokens per text before the tokenizer truncates
+INDEX_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY  # Share CPU index pages between workers
+HNSW_EF_SEARCH = 16  # Query-time search depth for the HNSW index
+# FAISS index files to search on CPU, in order of preference
+CPU_INDEX_FILES = ['faiss_sq8.bin', 'faiss_hnsw.bin', 'faiss_index.bin']
+BATCH_MAX_SIZE = 32  # Maximum number of queries searched together
+BATCH_MAX_WAIT = 0.005  # Seconds to wait for more queries to join a batch
+EMBEDDING_CACHE_SIZE = 4096  # Number of query embeddings to keep cached
+ANSWER_CACHE_SIZE = 1024  # Number of generated answers to keep cached
+RESPONSE_CACHE_SIZE = 512  # Number of serialized API responses to keep cached
+ANSWER_CACHE_TTL = 3600  # Seconds before a cached answer is regenerated
+
+# Keywords that mark a question as code-related, matched in a single pass
+CODE_KEYWORDS = frozenset(["code", "script", "programming", "function", "class",
+                           "implement", "python", "example", "syntax", "how to write"])
+CODE_KEYWORDS_RE = re.compile("|".join(re.escape(keyword) for keyword in sorted(CODE_KEYWORDS)))
+# Pattern to detect code blocks in a generated answer
+HAS_CODE_RE = re.compile(r"```\w*\n.*?\n```", re.DOTALL)
 
 # Create directory for models if it doesn't exist
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-# Initialize the LLM (will be loaded when first needed)
-llm = None
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that parses and serializes with orjson."""
+    
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string."""
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        """Deserialize a JSON string or bytes."""
+        return orjson.loads(s)
+
+def dump_json(data):
+    """Serialize data to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data).encode('utf-8')
+
+def json_response(data):
+    """Build a JSON response, writing orjson bytes directly when available."""
+    if orjson is not None:
+        return Response(dump_json(data), mimetype='application/json')
+    return jsonify(data)
+
+def response_cache_key(question, results):
+    """Hash a question and the sources retrieved for it into a cache key."""
+    sources = b",".join(str(result["source_file"]).encode('utf-8') for result in results)
+    key_data = normalize_question(question).encode('utf-8') + b"|" + sources
+    return hashlib.blake2b(key_data, digest_size=16).digest()
+
+def gpu_available():
+    """Check whether FAISS was built with GPU support and can see a GPU."""
+    return hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0
+
+def load_json(path):
+    """Load a JSON file, using the faster orjson parser when it is installed."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def normalize_question(text):
+    """Normalize case and whitespace so equivalent questions share cache entries."""
+    return " ".join(text.lower().split())
+
+class QueryBatcher:
+    """Coalesce concurrent queries into batched embedding and FAISS calls."""
+    
+    def __init__(self, rag, max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT):
+        """
+        Initialize the batcher
+        
+        Args:
+            rag: The OpenSimRAG instance whose query_batch method runs the search
+            max_batch_size (int): Maximum number of queries per batch
+            max_wait (float): Seconds to wait for more queries after the first
+        """
+        self.rag = rag
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        self.worker = None
+        self.worker_lock = threading.Lock()
+    
+    def submit(self, query_text, top_k=TOP_K):
+        """Queue a query and block until its batch has been searched."""
+        self.ensure_worker()
+        future = Future()
+        self.pending.put((query_text, top_k, future))
+        return future.result()
+    
+    def ensure_worker(self):
+        """Start the worker thread, including after a fork into a new process."""
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+    
+    def next_batch(self):
+        """Wait for a query, then collect any others arriving shortly after."""
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def run(self):
+        """Worker loop: search each batch and hand results back to callers."""
+        while True:
+            batch = self.next_batch()
+            query_texts = [query_text for query_text, _, _ in batch]
+            top_k = max(k for _, k, _ in batch)
+            
+            try:
+                query_results = self.rag.query_batch(query_texts, top_k)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            # Split the batched results back to each caller
+            for (_, k, future), query_result in zip(batch, query_results):
+                if "results" in query_result:
+                    query_result["results"] = query_result["results"][:k]
+                future.set_result(query_result)
 
 class OpenSimRAG:
     """OpenSim RAG system for answering queries about OpenSim."""
@@ -39,9 +189,23 @@ class OpenSimRAG:
         self.index = None
         self.chunks = None
         self.id_mapping = None
+        self.chunk_texts = None
+        self.chunk_offsets = None
+        self.chunk_titles = None
+        self.chunk_urls = None
+        self.chunk_sources = None
         self.embedding_model = None
         self.embedding_size = None
+        self.gpu_resources = None
+        self.batcher = QueryBatcher(self)
+        self.embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE)
+        self.answer_cache = LRUCache(ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+        self.response_cache = LRUCache(RESPONSE_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
         self.load_embedding_model()
+        
+        # Reusable C-contiguous buffer for batched query embeddings, written
+        # only by the batcher worker thread
+        self.query_buffer = np.empty((BATCH_MAX_SIZE, self.embedding_size), dtype=np.float32)
         self.load_data()
     
     def load_embedding_model(self):
@@ -64,120 +228,230 @@ class OpenSimRAG:
             self.embedding_model = SentenceTransformer(model_name, cache_folder=MODELS_DIR)
             self.embedding_size = self.embedding_model.get_sentence_embedding_dimension()
             print(f"Embedding model loaded. Dimension: {self.embedding_size}")
+        
+        # Let the fast tokenizer truncate long inputs in native code
+        self.embedding_model.max_seq_length = EMBEDDING_MAX_SEQ_LENGTH
     
     def load_data(self):
         """Load the vector database and chunks."""
-        # Load FAISS index
+        # Load FAISS index. With a GPU available, the exact flat index is
+        # searched on the GPU; otherwise use the first CPU index that exists.
         faiss_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_index.bin')
-        if os.path.exists(faiss_index_file):
+        if gpu_available() and os.path.exists(faiss_index_file):
             self.index = faiss.read_index(faiss_index_file)
-            print(f"Loaded FAISS index with {self.index.ntotal} vectors")
+            self.move_index_to_gpu()
+            print(f"Loaded FAISS GPU index with {self.index.ntotal} vectors")
         else:
-            print(f"Error: FAISS index file not found at {faiss_index_file}")
-            return False
+            index_files = [os.path.join(VECTOR_DB_DIR, name) for name in CPU_INDEX_FILES]
+            index_file = next((path for path in index_files if os.path.exists(path)), None)
+            if index_file is None:
+                print(f"Error: FAISS index file not found at {faiss_index_file}")
+                return False
+            
+            self.index = faiss.read_index(index_file, INDEX_IO_FLAGS)
+            if isinstance(self.index, faiss.IndexHNSW):
+                self.index.hnsw.efSearch = HNSW_EF_SEARCH
+            print(f"Loaded FAISS index {os.path.basename(index_file)} with {self.index.ntotal} vectors")
         
         # Load ID mapping
         mapping_file = os.path.join(VECTOR_DB_DIR, 'id_mapping.json')
         if os.path.exists(mapping_file):
-            with open(mapping_file, 'r') as f:
-                self.id_mapping = json.load(f)
+            self.id_mapping = np.asarray(load_json(mapping_file), dtype=np.int64)
             print(f"Loaded ID mapping with {len(self.id_mapping)} entries")
         else:
             print(f"Error: ID mapping file not found at {mapping_file}")
             return False
         
-        # Try to load successful chunks first, fall back to regular chunks
+        # Prefer the memory-mapped chunk store, then successful chunks,
+        # then fall back to regular chunks
+        metadata_file = os.path.join(VECTOR_DB_DIR, 'chunk_metadata.json')
+        texts_file = os.path.join(VECTOR_DB_DIR, 'chunks.bin')
+        offsets_file = os.path.join(VECTOR_DB_DIR, 'offsets.npy')
         successful_chunks_file = os.path.join(VECTOR_DB_DIR, 'successful_chunks.json')
-        chunks_file = os.path.join(PROCESSED_DIR, 'chunks.json')
+        chunks_file = os.path.join(PROCESSED_DIR, 'chunks.jsonl')
         
-        if os.path.exists(successful_chunks_file):
-            with open(successful_chunks_file, 'r', encoding='utf-8') as f:
-                self.chunks = json.load(f)
+        if all(os.path.exists(path) for path in (metadata_file, texts_file, offsets_file)):
+            self.chunks = load_json(metadata_file)
+            with open(texts_file, 'rb') as f:
+                self.chunk_texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.chunk_offsets = np.load(offsets_file, mmap_mode='r')
+            print(f"Loaded {len(self.chunks)} memory-mapped chunks from vector_db")
+        elif os.path.exists(successful_chunks_file):
+            self.chunks = load_json(successful_chunks_file)
             print(f"Loaded {len(self.chunks)} successful chunks from vector_db")
         elif os.path.exists(chunks_file):
             with open(chunks_file, 'r', encoding='utf-8') as f:
-                self.chunks = json.load(f)
+                self.chunks = [json.loads(line) for line in f if line.strip()]
             print(f"Loaded {len(self.chunks)} chunks from processed_data")
         else:
-            print(f"Error: Neither successful_chunks.json nor chunks.json found")
+            print(f"Error: Neither successful_chunks.json nor chunks.jsonl found")
             return False
         
+        # Extract metadata columns once - handling both original and fixed keys
+        self.chunk_titles = [chunk.get("title", chunk.get("Title", "Unknown")) for chunk in self.chunks]
+        self.chunk_urls = [chunk.get("url", chunk.get("URL", "")) for chunk in self.chunks]
+        self.chunk_sources = [chunk.get("source_file", "Unknown") for chunk in self.chunks]
+        
         return True
     
+    def get_chunk_text(self, chunk_id):
+        """Get the text of a chunk, reading it from the mapped store if loaded."""
+        if self.chunk_texts is None:
+            return self.chunks[chunk_id]["chunk_text"]
+        
+        start = int(self.chunk_offsets[chunk_id])
+        end = int(self.chunk_offsets[chunk_id + 1])
+        return self.chunk_texts[start:end].decode('utf-8')
+    
+    def move_index_to_gpu(self):
+        """Move the flat index to the GPU as an inner-product index.
+        
+        Query and chunk embeddings are unit length, so inner product gives
+        cosine similarity directly.
+        """
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        cpu_index = faiss.IndexFlatIP(self.index.d)
+        cpu_index.add(vectors)
+        
+        # Keep the resources alive for as long as the GPU index is in use
+        self.gpu_resources = faiss.StandardGpuResources()
+        self.index = faiss.index_cpu_to_gpu(self.gpu_resources, 0, cpu_index)
+    
     def get_embedding(self, text):
         """Get embedding vector for a text using Sentence Transformers."""
-        try:
-            # Handle empty or very short text
-            if not text or len(text.strip()) < 5:
-                return np.zeros(self.embedding_size, dtype=np.float32)
-            
-            # Limit text length to avoid memory issues
-            if len(text) > 10000:
-                text = text[:10000]
-            
-            # Get embedding from Sentence Transformers
-            embedding = self.embedding_model.encode(text, show_progress_bar=False)
-            
-            # Ensure correct type
-            embedding = np.array(embedding, dtype=np.float32)
+        return self.get_embeddings([text])[0]
+    
+    def get_embeddings(self, texts):
+        """
+        Get embedding vectors for a batch of texts using Sentence Transformers
+        
+        Args:
+            texts (list): Texts to embed
             
-            # Normalize to unit length
-            norm = np.linalg.norm(embedding)
-            if norm > 0:
-                embedding = embedding / norm
+        Returns:
+            np.ndarray: (len(texts), embedding_size) float32 array of unit
+                vectors, with zero rows for empty or very short texts
+        """
+        embeddings = np.zeros((len(texts), self.embedding_size), dtype=np.float32)
+        
+        # Handle empty or very short text
+        rows = [row for row, text in enumerate(texts) if text and len(text.strip()) >= 5]
+        if not rows:
+            return embeddings
+        
+        try:
+            batch = [texts[row] for row in rows]
             
-            return embedding
+            # The model normalizes to unit length as part of the forward pass
+            embeddings[rows] = self.embedding_model.encode(
+                batch,
+                batch_size=32,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
         
         except Exception as e:
-            print(f"Error generating embedding: {e}")
-            # Return zero vector in case of error
-            return np.zeros(self.embedding_size, dtype=np.float32)
-    
-    def query(self, query_text, top_k=TOP_K):
-        """Query the RAG system with a question."""
-        if not self.index or not self.chunks or not self.id_mapping:
-            return {"error": "RAG system not properly initialized"}
-        
-        # Get query embedding
-        query_embedding = self.get_embedding(query_text)
-        query_embedding = query_embedding.reshape(1, -1)
-        
-        # Search the index
-        distances, indices = self.index.search(query_embedding, top_k)
-        
-        # Get the chunks
-        results = []
-        for i, idx in enumerate(indices[0]):
-            # Check if index is valid
-            if idx < 0 or idx >= len(self.id_mapping):
-                continue
-                
-            # Get corresponding chunk ID
-            chunk_id = self.id_mapping[idx]
-            
-            # Check if chunk ID is valid
-            if chunk_id < 0 or chunk_id >= len(self.chunks):
-                continue
-                
-            # Get the chunk and add to results
-            chunk = self.chunks[chunk_id]
-            
-            # Extract metadata - handling both original and fixed keys
-            chunk_title = chunk.get("title", chunk.get("Title", "Unknown"))
-            chunk_url = chunk.get("url", chunk.get("URL", ""))
+            print(f"Error generating embeddings: {e}")
+        
+        return embeddings
+    
+    def query(self, query_text, top_k=TOP_K, min_score=None, max_chunks=None):
+        """
+        Query the RAG system with a question
+        
+        Args:
+            query_text (str): The question
+            top_k (int): Number of nearest chunks to search for
+            min_score (float): Drop hits scoring below this, if given
+            max_chunks (int): Keep at most this many hits, if given
             
-            results.append({
-                "chunk_text": chunk["chunk_text"],
-                "source_file": chunk.get("source_file", "Unknown"),
-                "title": chunk_title,
-                "url": chunk_url,
-                "score": float(1.0 / (1.0 + distances[0][i]))  # Convert distance to score
-            })
-        
-        return {
-            "query": query_text,
-            "results": results
-        }
+        Returns:
+            dict: The query and its results, best first
+        """
+        # Concurrent queries are coalesced into a single batched search
+        query_result = self.batcher.submit(query_text, top_k)
+        
+        # Keep only hits close to the best one, on the index's own distance scale
+        if "results" in query_result:
+            query_result["results"] = prune_results(
+                query_result["results"], self.index.metric_type == faiss.METRIC_INNER_PRODUCT,
+                min_score, max_chunks
+            )
+        return query_result
+    
+    def query_batch(self, query_texts, top_k=TOP_K):
+        """Query the RAG system with several questions in one search call."""
+        if not self.index or not self.chunks or self.id_mapping is None or len(self.id_mapping) == 0:
+            return [{"error": "RAG system not properly initialized"} for _ in query_texts]
+        
+        query_embeddings = self.embed_queries(query_texts)
+        
+        # Search the index for all queries at once
+        distances, indices = self.index.search(query_embeddings, top_k)
+        
+        return [
+            {
+                "query": query_text,
+                "results": self.collect_results(distances[row], indices[row])
+            }
+            for row, query_text in enumerate(query_texts)
+        ]
+    
+    def embed_queries(self, query_texts):
+        """Embed queries, reusing cached embeddings for repeated questions."""
+        keys = [normalize_question(query_text) for query_text in query_texts]
+        
+        # Fill the preallocated query buffer instead of allocating per batch
+        if len(query_texts) > len(self.query_buffer):
+            self.query_buffer = np.empty((len(query_texts), self.embedding_size), dtype=np.float32)
+        query_embeddings = self.query_buffer[:len(query_texts)]
+        
+        missing_rows = []
+        for row, key in enumerate(keys):
+            cached = self.embedding_cache.get(key)
+            if cached is None:
+                missing_rows.append(row)
+            else:
+                np.copyto(query_embeddings[row], cached)
+        
+        if missing_rows:
+            # Encode all cache misses in one forward pass
+            embeddings = self.get_embeddings([query_texts[row] for row in missing_rows])
+            query_embeddings[missing_rows] = embeddings
+            for row, embedding in zip(missing_rows, embeddings):
+                if embedding.any():  # Don't cache the zero vector of a failed encode
+                    self.embedding_cache.put(keys[row], embedding)
+        
+        return query_embeddings
+    
+    def collect_results(self, distances, indices):
+        """Look up the chunks for one row of FAISS search results."""
+        # Drop invalid indices (FAISS pads missing hits with -1)
+        valid = (indices >= 0) & (indices < len(self.id_mapping))
+        chunk_ids = self.id_mapping[indices[valid]]
+        distances = distances[valid]
+        
+        # Drop chunk IDs that fall outside the loaded chunks
+        valid = (chunk_ids >= 0) & (chunk_ids < len(self.chunks))
+        
+        return [
+            {
+                "chunk_text": self.get_chunk_text(chunk_id),
+                "source_file": self.chunk_sources[chunk_id],
+                "title": self.chunk_titles[chunk_id],
+                "url": self.chunk_urls[chunk_id],
+                "score": self.distance_to_score(distance),
+                "distance": distance
+            }
+            for chunk_id, distance in zip(chunk_ids[valid].tolist(), distances[valid].tolist())
+        ]
+    
+    def distance_to_score(self, distance):
+        """Convert a FAISS distance to a relevance score."""
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return float(distance)  # Already a cosine similarity
+        return float(1.0 / (1.0 + distance))  # Convert L2 distance to score
     
     def format_answer(self, question, contexts, sources):
         """Format the answer using the retrieved contexts."""
@@ -198,14 +472,55 @@ class OpenSimRAG:
             answer += f"{context}\n\n"
             
         # Convert markdown to HTML
-        html_answer = markdown.markdown(answer)
+        html_answer = render_markdown(answer)
         
         return html_answer
     
-    def answer_question(self, question):
-        """Answer a question using the RAG system with LLM-generated responses."""
-        # Get relevant chunks
+    def answer_question_json(self, question, use_cache=True):
+        """
+        Answer a question and return the serialized JSON response body
+        
+        Responses are cached as bytes, keyed by the question and the sources
+        retrieved for it, so repeat traffic skips building the answer dict.
+        
+        Args:
+            question (str): The user question
+            use_cache (bool): Whether cached answers may be served
+            
+        Returns:
+            bytes: JSON-encoded answer
+        """
         query_result = self.query(question)
+        if "error" in query_result:
+            return dump_json({"error": query_result["error"]})
+        
+        cache_key = response_cache_key(question, query_result["results"])
+        if use_cache:
+            cached_body = self.response_cache.get(cache_key)
+            if cached_body is not None:
+                return cached_body
+        
+        answer = self.answer_question(question, query_result, use_cache)
+        body = dump_json(answer)
+        
+        # Only cache LLM answers, not errors or the context-only fallback
+        if "error" not in answer and "formatted_answer" not in answer:
+            self.response_cache.put(cache_key, body)
+        
+        return body
+    
+    def answer_question(self, question, query_result=None, use_cache=True):
+        """Answer a question using the RAG system with LLM-generated responses."""
+        # Serve repeated questions straight from the answer cache
+        cache_key = normalize_question(question)
+        if use_cache:
+            cached_answer = self.answer_cache.get(cache_key)
+            if cached_answer is not None:
+                return dict(cached_answer)
+        
+        # Get relevant chunks unless the caller already retrieved them
+        if query_result is None:
+            query_result = self.query(question)
         
         if "error" in query_result:
             return {"error": query_result["error"]}
@@ -226,31 +541,21 @@ class OpenSimRAG:
         # Combine the contexts
         combined_context = "\n\n".join(contexts)
         
-        # Generate LLM response
-        global llm
-        if llm is None:
-            # Create base LLM
-            base_llm = MistralLLM()
-            
-            # Check if this is a code-related question
-            code_keywords = ["code", "script", "programming", "function", "class", 
-                            "implement", "python", "example", "syntax", "how to write"]
-            is_code_question = any(keyword in question.lower() for keyword in code_keywords)
-            
-            # Only wrap with CodeFormattingLLM if enhanced formatting is needed
-            if is_code_question:
-                llm = CodeFormattingLLM(base_llm)
-                print("Enhanced LLM initialized with code formatting capabilities")
-            else:
-                llm = base_llm
-                print("Standard LLM initialized")
+        # Check if this is a code-related question
+        is_code_question = bool(CODE_KEYWORDS_RE.search(question.lower()))
+        
+        # Only use CodeFormattingLLM if enhanced formatting is needed
+        llm = code_llm if is_code_question else base_llm
         
         try:
+            if llm is None:
+                raise RuntimeError("Mistral LLM is not loaded")
+            
             # Generate response using LLM
-            generated_answer = llm.generate_response(question, contexts)
+            generated_answer = llm.generate_response(question, contexts, use_cache=use_cache)
             
             # Check if response contains code blocks
-            has_code = bool(re.search(r"```\w*\n.*?\n```", generated_answer, re.DOTALL))
+            has_code = bool(HAS_CODE_RE.search(generated_answer))
             
             # Format sources for display
             formatted_sources = []
@@ -271,7 +576,8 @@ class OpenSimRAG:
                 "has_code": has_code
             }
             
-            return answer
+            self.answer_cache.put(cache_key, answer)
+            return dict(answer)
             
         except Exception as e:
             print(f"Error using LLM for response generation: {e}")
@@ -292,11 +598,23 @@ class OpenSimRAG:
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='./web/static', template_folder='./web/templates')
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Initialize RAG system
 print("Initializing OpenSim RAG system...")
 rag_system = OpenSimRAG()
 
+# Initialize the LLMs up front so no request pays the model load
+print("Initializing Mistral LLM...")
+try:
+    base_llm = MistralLLM()
+    code_llm = CodeFormattingLLM(base_llm)
+except RuntimeError as e:
+    print(f"Error loading Mistral LLM, answers will fall back to retrieved context: {e}")
+    base_llm = None
+    code_llm = None
+
 @app.route('/')
 def index():
     """Render the main page."""
@@ -309,10 +627,58 @@ def api_query():
     question = data.get('question', '')
     
     if not question:
-        return jsonify({"error": "No question provided"})
+        return json_response({"error": "No question provided"})
+    
+    # ?nocache=1 regenerates the answer instead of serving a cached one
+    use_cache = request.args.get('nocache') != '1'
+    
+    body = rag_system.answer_question_json(question, use_cache)
+    return Response(body, mimetype='application/json')
+
+@app.route('/api/query/stream', methods=['POST'])
+def api_query_stream():
+    """API endpoint streaming the generated answer as server-sent events."""
+    data = request.json
+    question = data.get('question', '')
+    
+    if not question:
+        return json_response({"error": "No question provided"})
+    
+    if base_llm is None:
+        return json_response({"error": "Mistral LLM is not loaded"})
+    
+    query_result = rag_system.query(question)
+    if "error" in query_result:
+        return json_response({"error": query_result["error"]})
+    
+    contexts = [result["chunk_text"] for result in query_result["results"]]
+    sources = [
+        {
+            "index": i+1,
+            "title": result.get("title", "Unknown"),
+            "url": result.get("url", ""),
+            "file": result.get("source_file", "")
+        }
+        for i, result in enumerate(query_result["results"])
+    ]
+    
+    is_code_question = bool(CODE_KEYWORDS_RE.search(question.lower()))
+    
+    def events():
+        # Send the sources first, then each piece of text as it is decoded
+        yield b"event: sources\ndata: " + dump_json(sources) + b"\n\n"
+        pieces = []
+        for text in base_llm.stream_response(question, contexts):
+            pieces.append(text)
+            yield b"data: " + dump_json(text) + b"\n\n"
+        
+        # Code blocks can only be formatted once the whole answer is known,
+        # so code answers end with the formatted text, as /api/query returns it
+        if is_code_question:
+            yield b"event: formatted\ndata: " + dump_json(format_code_blocks("".join(pieces))) + b"\n\n"
+        yield b"event: done\ndata: {}\n\n"
     
-    result = rag_system.answer_question(question)
-    return jsonify(result)
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/static/<path:path>')
 def serve_static(path):
@@ -328,8 +694,8 @@ def main():
         print("Error: RAG system not properly initialized")
         return
     
-    # Run the Flask app
-    app.run(host='0.0.0.0', port=5100, debug=True)
+    # Run the Flask development server; deploy with gunicorn via wsgi.py
+    app.run(host='0.0.0.0', port=5100, debug=False)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,4 +1,15 @@
 import re
+import textwrap
+
+try:
+    import re2  # google-re2: linear-time matching, no backtracking
+except ImportError:
+    re2 = None
+
+# Pattern to match code blocks (including the language specifier). The
+# inline (?s) flag lets . match newlines under both re2 and re.
+CODE_BLOCK_PATTERN = r"(?s)```(\w*)\n(.*?)\n```"
+CODE_BLOCK_RE = (re2 or re).compile(CODE_BLOCK_PATTERN)
 
 def format_code_blocks(text):
     """
@@ -10,30 +21,19 @@ def format_code_blocks(text):
     Returns:
         str: Text with properly formatted code blocks
     """
-    # Pattern to match code blocks (including the language specifier)
-    pattern = r"```(\w*)\n(.*?)\n```"
-    
     def format_code(match):
         language = match.group(1) or "python"  # Default to python if language not specified
         code = match.group(2)
         
-        # Remove excess blank lines at beginning and end
-        code = code.strip()
-        
-        # Standardize indentation (4 spaces)
-        lines = code.split('\n')
-        # Find the minimum indentation (excluding empty lines)
-        non_empty_lines = [line for line in lines if line.strip()]
-        if non_empty_lines:
-            min_indent = min(len(line) - len(line.lstrip()) for line in non_empty_lines if line.strip())
-            # Remove common leading whitespace but maintain relative indentation
-            code = '\n'.join(line[min_indent:] if line.strip() else line for line in lines)
+        # Remove common leading whitespace but maintain relative indentation,
+        # then remove excess blank lines at beginning and end
+        code = textwrap.dedent(code).strip()
         
         # Add proper language specifier
         return f"```{language}\n{code}\n```"
     
     # Replace all code blocks with properly formatted ones
-    formatted_text = re.sub(pattern, format_code, text, flags=re.DOTALL)
+    formatted_text = CODE_BLOCK_RE.sub(format_code, text)
     return formatted_text
 
 class CodeFormattingLLM:
@@ -48,7 +48,7 @@ class CodeFormattingLLM:
         """
         self.base_llm = base_llm
     
-    def generate_response(self, query, context_chunks, max_length=256):
+    def generate_response(self, query, context_chunks, max_length=256, deterministic=False, use_cache=True):
         """
         Generate a response and post-process it to format code blocks properly
         
@@ -56,12 +56,15 @@ class CodeFormattingLLM:
             query (str): The user query
             context_chunks (list): List of context chunk strings
             max_length (int): Maximum length for generation
+            deterministic (bool): Decode greedily instead of sampling
+            use_cache (bool): Whether a cached response may be returned
             
         Returns:
             str: Formatted response with properly formatted code blocks
         """
         # Generate response using the base LLM
-        response = self.base_llm.generate_response(query, context_chunks, max_length)
+        response = self.base_llm.generate_response(query, context_chunks, max_length, deterministic=deterministic,
+                                                  use_cache=use_cache)
         
         # Post-process to format code blocks
         formatted_response = format_code_blocks(response)
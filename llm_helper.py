@@ -7,12 +7,55 @@ with optimizations for memory efficiency and response quality.
 """
 
 import os
+import hashlib
+import importlib.util
 import torch
 import re
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import threading
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, TextIteratorStreamer
+from code_formatter import format_code_blocks
+from lru_cache import LRUCache
+
+try:
+    from transformers import StaticCache
+except ImportError:  # transformers < 4.38
+    StaticCache = None
+
+# Generation limits
+MAX_PROMPT_TOKENS = 4096  # Prompts are truncated to this many tokens
+MAX_NEW_TOKENS = 256  # Default number of tokens to generate
+RESPONSE_CACHE_SIZE = 1024  # Number of greedy responses to keep cached
+RESPONSE_CACHE_TTL = 3600  # Seconds before a cached response is regenerated
+
+# Attention implementations that can read and write a StaticCache
+STATIC_CACHE_ATTN_IMPLEMENTATIONS = frozenset(["sdpa", "eager"])
+
+# Keywords that mark a question as asking for code, matched in one pass
+CODE_KEYWORDS = frozenset(["code", "script", "programming", "function", "class",
+                           "implement", "python", "example", "syntax", "how to write"])
+CODE_KEYWORDS_RE = re.compile("|".join(re.escape(keyword) for keyword in sorted(CODE_KEYWORDS)))
+
+# Static parts of the Mistral instruction prompt, shared by every query
+PROMPT_PREFIX = "[INST] You are OpenSimAssistant, a helpful AI focused on OpenSim documentation.\n\n"
+PROMPT_BODY_TEMPLATE = """Context Information:
+{context}
+
+User Question: {query}
+
+"""
+CODE_PROMPT_SUFFIX = """Provide a clear, well-formatted code example with:
+1. Proper imports at the top
+2. Clear function definitions with docstrings
+3. Consistent indentation (4 spaces)
+4. Helpful comments explaining key operations
+5. Code that can be directly copy-pasted and executed
+
+Format all code with proper Python triple backticks (```python) and ensure it follows best practices. [/INST]"""
+NORMAL_PROMPT_SUFFIX = """Provide a clear, concise, and accurate response based on the context. 
+If the information is incomplete, explain what you know and suggest further research. [/INST]"""
 
 class MistralLLM:
-    def __init__(self, models_dir="./models/mistral"):
+    def __init__(self, models_dir="./models/mistral", quantization="4bit", backend=None):
         """
         Initialize the Mistral Language Model
         
@@ -20,9 +63,34 @@ class MistralLLM:
         1. Load the Mistral model from local files
         2. Set up tokenizer and model with optimized settings
         3. Prepare for efficient response generation
+        
+        Args:
+            models_dir (str): Directory containing the Mistral model files
+            quantization (str): "4bit" for bitsandbytes NF4 weights, "8bit"
+                for bitsandbytes int8 weights, "int8" for torchao int8
+                weight-only quantization (fused int8 matmul under
+                torch.compile), or None to keep half-precision weights
+            backend (str): "vllm" to serve with a vLLM engine, "hf" for
+                transformers generate(), or None to use vLLM when available
         """
         self.models_dir = models_dir
-        self._load_model()
+        self.quantization = quantization
+        if backend is None:
+            backend = "vllm" if torch.cuda.is_available() and importlib.util.find_spec("vllm") else "hf"
+        self.backend = backend
+        self.engine = None
+        self.attn_implementation = None
+        self.cache = None
+        # The static KV cache and the offline vLLM engine are shared and not
+        # thread-safe, so generation runs one call at a time
+        self.generate_lock = threading.Lock()
+        # Greedy responses are deterministic, so repeats can be served from cache
+        self.response_cache = LRUCache(RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        
+        if self.backend == "vllm":
+            self._load_engine()
+        else:
+            self._load_model()
     
     def _load_model(self):
         """
@@ -44,21 +112,221 @@ class MistralLLM:
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
+            self._tokenize_prompt_parts()
+            
+            # bf16 keeps the fp32 exponent range at fp16 cost where supported
+            if torch.cuda.is_available() and torch.cuda.is_bf16_supported():
+                torch_dtype = torch.bfloat16
+            else:
+                torch_dtype = torch.float16
+            
+            # FlashAttention-2 fuses attention into tiled kernels during prefill
+            if torch.cuda.is_available() and importlib.util.find_spec("flash_attn"):
+                attn_implementation = "flash_attention_2"
+            else:
+                attn_implementation = "sdpa"
+            
             # Load model with optimized settings
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.models_dir,
                 device_map="auto",  # Automatically distribute across available devices
-                torch_dtype=torch.float16,  # Reduce memory usage
+                torch_dtype=torch_dtype,  # Reduce memory usage
+                attn_implementation=attn_implementation,
+                quantization_config=self._quantization_config(torch_dtype),
                 trust_remote_code=True
             )
+            self.model.generation_config.use_cache = True
+            self._quantize_int8_weights()
+            self.attn_implementation = attn_implementation
+            self.cache = self._create_static_cache(torch_dtype)
             
             print("Mistral model loaded successfully!")
+            
+            self._compile_model()
+        
+        except Exception as e:
+            print(f"Model loading error: {e}")
+            raise RuntimeError(f"Failed to load Mistral model: {e}")
+    
+    def _create_static_cache(self, dtype):
+        """
+        Pre-allocate a fixed-size KV cache reused by every generate() call
+        
+        Fixed-shape KV buffers avoid re-allocating cache tensors per query
+        and keep kernel shapes stable between calls. FlashAttention-2 does
+        not support a static cache, so it keeps the dynamic cache instead.
+        
+        Args:
+            dtype (torch.dtype): Dtype of the cached keys and values
+            
+        Returns:
+            StaticCache or None: The cache, or None if it cannot be created
+        """
+        if StaticCache is None:
+            return None
+        
+        if self.attn_implementation not in STATIC_CACHE_ATTN_IMPLEMENTATIONS:
+            return None
+        
+        try:
+            return StaticCache(
+                config=self.model.config,
+                max_batch_size=1,
+                max_cache_len=MAX_PROMPT_TOKENS + MAX_NEW_TOKENS,
+                device=self.model.device,
+                dtype=dtype
+            )
+        except Exception as e:
+            print(f"Static KV cache unavailable, using dynamic cache: {e}")
+            return None
+    
+    def _tokenize_prompt_parts(self):
+        """
+        Tokenize the static prompt prefix and suffixes once
+        
+        Only the context and question change between queries, so only that
+        part is tokenized per call; the token IDs are then concatenated.
+        """
+        self._prefix_ids = self.tokenizer(PROMPT_PREFIX, return_tensors="pt")["input_ids"]
+        self._code_suffix_ids = self.tokenizer(
+            CODE_PROMPT_SUFFIX, add_special_tokens=False, return_tensors="pt"
+        )["input_ids"]
+        self._normal_suffix_ids = self.tokenizer(
+            NORMAL_PROMPT_SUFFIX, add_special_tokens=False, return_tensors="pt"
+        )["input_ids"]
+    
+    def _build_input_ids(self, prompt_body, is_code_question):
+        """
+        Build prompt token IDs from the cached prefix/suffix and the query body
+        
+        Args:
+            prompt_body (str): The per-query context and question text
+            is_code_question (bool): Whether to use the code instructions
+            
+        Returns:
+            torch.Tensor: (1, seq_len) prompt token IDs
+        """
+        suffix_ids = self._code_suffix_ids if is_code_question else self._normal_suffix_ids
+        
+        # Truncate the body so the instructions always fit in the prompt
+        budget = MAX_PROMPT_TOKENS - self._prefix_ids.shape[1] - suffix_ids.shape[1]
+        body_ids = self.tokenizer(
+            prompt_body, add_special_tokens=False, return_tensors="pt",
+            truncation=True, max_length=budget
+        )["input_ids"]
+        
+        return torch.cat([self._prefix_ids, body_ids, suffix_ids], dim=1)
+    
+    def _compile_model(self):
+        """
+        Compile the model forward pass with TorchInductor
+        
+        "reduce-overhead" captures CUDA graphs for the fixed shapes given by
+        the static KV cache, removing per-step Python dispatch during decode.
+        A warm-up generation pays the compilation cost at startup, and any
+        failure (e.g. an older torch) falls back to eager mode.
+        """
+        if not torch.cuda.is_available() or self.cache is None or not hasattr(torch, "compile"):
+            return
+        
+        eager_forward = self.model.forward
+        try:
+            self.model.forward = torch.compile(
+                eager_forward, mode="reduce-overhead", fullgraph=False, dynamic=False
+            )
+            
+            print("Warming up compiled Mistral model...")
+            warmup_ids = self._build_input_ids("User Question: What is OpenSim?\n\n", False)
+            self._generate_with_model(warmup_ids, MAX_NEW_TOKENS)
+            print("Mistral model compiled successfully!")
+        
+        except Exception as e:
+            print(f"torch.compile failed, using eager mode: {e}")
+            self.model.forward = eager_forward
+    
+    def _load_engine(self):
+        """
+        Load the Mistral model into a vLLM engine
+        
+        PagedAttention keeps the KV cache in fixed-size blocks, and prefix
+        caching reuses the KV cache of the instruction preamble shared by
+        every prompt. The offline engine is not thread-safe, so requests are
+        generated one at a time under generate_lock rather than batched.
+        """
+        try:
+            from vllm import LLM
+            
+            self.engine = LLM(
+                model=self.models_dir,
+                dtype="bfloat16",
+                enable_prefix_caching=True,
+                max_model_len=4096
+            )
+            self.tokenizer = self.engine.get_tokenizer()
+            self.model = None
+            
+            self._tokenize_prompt_parts()
+            
+            print("Mistral vLLM engine loaded successfully!")
         
         except Exception as e:
             print(f"Model loading error: {e}")
             raise RuntimeError(f"Failed to load Mistral model: {e}")
     
-    def generate_response(self, query, context_chunks, max_length=256):
+    def _quantization_config(self, compute_dtype):
+        """
+        Build the bitsandbytes weight quantization config
+        
+        Decoding streams every weight once per token, so smaller weights
+        mean proportionally less memory traffic. bitsandbytes needs CUDA,
+        so the model falls back to unquantized weights elsewhere.
+        
+        Args:
+            compute_dtype (torch.dtype): Dtype used for activations and matmuls
+            
+        Returns:
+            BitsAndBytesConfig or None: Config to pass to from_pretrained
+        """
+        if not self.quantization or self.quantization == "int8":
+            return None  # torchao int8 is applied after loading
+        
+        if not torch.cuda.is_available() or not importlib.util.find_spec("bitsandbytes"):
+            print("bitsandbytes quantization needs CUDA and bitsandbytes, loading unquantized weights")
+            return None
+        
+        if self.quantization == "4bit":
+            return BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=compute_dtype,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_use_double_quant=True
+            )
+        
+        if self.quantization == "8bit":
+            return BitsAndBytesConfig(load_in_8bit=True)
+        
+        raise ValueError(f"Unsupported quantization: {self.quantization}")
+    
+    def _quantize_int8_weights(self):
+        """
+        Quantize the loaded weights to int8 in place with torchao
+        
+        Combined with torch.compile, int8 weight-only linears run as a single
+        fused int8 matmul kernel instead of a dequantize + matmul pair.
+        """
+        if self.quantization != "int8":
+            return
+        
+        try:
+            from torchao.quantization import quantize_, int8_weight_only
+            
+            quantize_(self.model, int8_weight_only())
+            print("Mistral weights quantized to int8")
+        except ImportError:
+            print("torchao not installed, keeping half-precision weights")
+    
+    def generate_response(self, query, context_chunks, max_length=MAX_NEW_TOKENS, deterministic=False,
+                          use_cache=True):
         """
         Generate a response based on query and context
         
@@ -67,128 +335,218 @@ class MistralLLM:
         2. Create an instruction-based prompt
         3. Generate response using Mistral's specific format
         4. Clean and return the response
-        """
-        # Combine context chunks
-        context = "\n\n".join([chunk.strip() for chunk in context_chunks])
-        
-        # Truncate context if too long
-        if len(context) > 3000:
-            context = context[:3000] + "..."
         
+        Code questions, and any call with deterministic=True, are decoded
+        greedily instead of sampled. Greedy responses are cached, keyed by
+        the query and its context, unless use_cache is False.
+        """
         # Check if query is likely about code
-        code_keywords = ["code", "script", "programming", "function", "class", 
-                        "implement", "python", "example", "syntax", "how to write"]
-        is_code_question = any(keyword in query.lower() for keyword in code_keywords)
+        is_code_question = bool(CODE_KEYWORDS_RE.search(query.lower()))
+        greedy = deterministic or is_code_question
         
-        # Create Mistral-specific instruction prompt
-        if is_code_question:
-            prompt = f"""<s>[INST] You are OpenSimAssistant, a helpful AI focused on OpenSim documentation.
-
-Context Information:
-{context}
-
-User Question: {query}
-
-Provide a clear, well-formatted code example with:
-1. Proper imports at the top
-2. Clear function definitions with docstrings
-3. Consistent indentation (4 spaces)
-4. Helpful comments explaining key operations
-5. Code that can be directly copy-pasted and executed
-
-Format all code with proper Python triple backticks (```python) and ensure it follows best practices. [/INST]"""
-        else:
-            prompt = f"""<s>[INST] You are OpenSimAssistant, a helpful AI focused on OpenSim documentation.
-
-Context Information:
-{context}
-
-User Question: {query}
-
-Provide a clear, concise, and accurate response based on the context. 
-If the information is incomplete, explain what you know and suggest further research. [/INST]"""
+        # Sampled responses vary between calls, so only greedy ones are cached
+        cache_key = self._response_cache_key(query, context_chunks, max_length) if greedy else None
+        if cache_key is not None and use_cache:
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+        
+        prompt_body = self._build_prompt_body(query, context_chunks, is_code_question, max_length)
         
         try:
-            # Tokenize input
-            inputs = self.tokenizer(
-                prompt, 
-                return_tensors="pt", 
-                padding=True, 
-                truncation=True, 
-                max_length=4096
-            )
-            
-            # Move inputs to model's device
-            inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
-            
-            # Generate response
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    input_ids=inputs["input_ids"],
-                    attention_mask=inputs["attention_mask"],
-                    max_new_tokens=max_length,
-                    temperature=0.7,
-                    do_sample=True,
-                    top_p=0.9,
-                    top_k=50,
-                    pad_token_id=self.tokenizer.eos_token_id
-                )
-            
-            # Decode and clean response
-            full_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Extract response after instruction
-            response_start = full_response.find('[/INST]')
-            if response_start != -1:
-                response = full_response[response_start+7:].strip()
+            if self.engine is not None:
+                suffix = CODE_PROMPT_SUFFIX if is_code_question else NORMAL_PROMPT_SUFFIX
+                response = self._generate_with_engine(PROMPT_PREFIX + prompt_body + suffix, max_length, greedy)
             else:
-                response = full_response.replace(prompt, "").strip()
+                input_ids = self._build_input_ids(prompt_body, is_code_question)
+                response = self._generate_with_model(input_ids, max_length, greedy)
             
             # Format code blocks if this is a code-related question
             if is_code_question:
                 response = self._format_code_blocks(response)
             
-            return response or self.fallback_response(query)
+            if not response:
+                return self.fallback_response(query)
+            
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response)
+            return response
         
         except Exception as e:
             print(f"Response generation error: {e}")
             return self.fallback_response(query)
     
-    def _format_code_blocks(self, text):
+    def stream_response(self, query, context_chunks, max_length=MAX_NEW_TOKENS, deterministic=False):
         """
-        Format code blocks to ensure proper indentation and structure
+        Generate a response based on query and context, yielding text as it is decoded
         
         Args:
-            text (str): Text containing code blocks
+            query (str): The user query
+            context_chunks (list): List of context chunk strings
+            max_length (int): Maximum number of tokens to generate
+            deterministic (bool): Decode greedily instead of sampling
             
-        Returns:
-            str: Text with properly formatted code blocks
+        Yields:
+            str: Successive pieces of the response
+        """
+        # The offline vLLM engine only returns whole completions
+        if self.engine is not None:
+            yield self.generate_response(query, context_chunks, max_length, deterministic)
+            return
+        
+        is_code_question = bool(CODE_KEYWORDS_RE.search(query.lower()))
+        greedy = deterministic or is_code_question
+        
+        prompt_body = self._build_prompt_body(query, context_chunks, is_code_question, max_length)
+        input_ids = self._build_input_ids(prompt_body, is_code_question)
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        
+        def run_generation():
+            try:
+                self._generate_with_model(input_ids, max_length, greedy, streamer)
+            except Exception as e:
+                print(f"Response generation error: {e}")
+                streamer.end()  # Unblock the consumer
+        
+        # Generate in the background and hand decoded text out as it arrives
+        threading.Thread(target=run_generation, daemon=True).start()
+        for text in streamer:
+            if text:
+                yield text
+    
+    def _build_prompt_body(self, query, context_chunks, is_code_question, max_length):
         """
-        # Pattern to match code blocks (including the language specifier)
-        pattern = r"```(\w*)\n(.*?)\n```"
+        Build the per-query part of the prompt
         
-        def format_code(match):
-            language = match.group(1) or "python"  # Default to python if not specified
-            code = match.group(2)
+        Args:
+            query (str): The user query
+            context_chunks (list): List of context chunk strings
+            is_code_question (bool): Whether the code instructions are used
+            max_length (int): Number of tokens reserved for the response
             
-            # Remove excess blank lines at beginning and end
-            code = code.strip()
+        Returns:
+            str: The context and question text between the prefix and suffix
+        """
+        # Give the context whatever the instructions, question and answer leave
+        suffix_ids = self._code_suffix_ids if is_code_question else self._normal_suffix_ids
+        question_ids = self.tokenizer(
+            PROMPT_BODY_TEMPLATE.format(context="", query=query), add_special_tokens=False
+        )["input_ids"]
+        budget = (MAX_PROMPT_TOKENS - self._prefix_ids.shape[1] - suffix_ids.shape[1]
+                  - len(question_ids) - max_length)
+        
+        context = self._pack_context(context_chunks, budget)
+        
+        # Create Mistral-specific instruction prompt; only the body varies
+        return PROMPT_BODY_TEMPLATE.format(context=context, query=query)
+    
+    def _response_cache_key(self, query, context_chunks, max_length):
+        """Hash a query, its context chunks and the length limit into a cache key."""
+        key_text = "\0".join([str(max_length), " ".join(query.lower().split())] + sorted(context_chunks))
+        return hashlib.sha1(key_text.encode('utf-8')).hexdigest()
+    
+    def _pack_context(self, context_chunks, budget):
+        """
+        Combine deduplicated context chunks within a token budget
+        
+        Args:
+            context_chunks (list): Retrieved chunk texts, most relevant first
+            budget (int): Maximum number of context tokens
             
-            # Standardize indentation (4 spaces)
-            lines = code.split('\n')
-            # Find the minimum indentation (excluding empty lines)
-            non_empty_lines = [line for line in lines if line.strip()]
-            if non_empty_lines:
-                min_indent = min(len(line) - len(line.lstrip()) for line in non_empty_lines if line.strip())
-                # Remove common leading whitespace but maintain relative indentation
-                code = '\n'.join(line[min_indent:] if line.strip() else line for line in lines)
+        Returns:
+            str: The combined context
+        """
+        # Drop repeated chunks, keeping the retrieval order
+        seen = set()
+        unique_chunks = []
+        for chunk in context_chunks:
+            chunk = chunk.strip()
+            if chunk and chunk not in seen:
+                seen.add(chunk)
+                unique_chunks.append(chunk)
+        
+        if not unique_chunks or budget <= 0:
+            return ""
+        
+        # Greedily add whole chunks, cutting the first one that does not fit
+        chunk_ids = self.tokenizer(unique_chunks, add_special_tokens=False)["input_ids"]
+        separator_len = len(self.tokenizer("\n\n", add_special_tokens=False)["input_ids"])
+        
+        packed = []
+        remaining = budget
+        for chunk, ids in zip(unique_chunks, chunk_ids):
+            if len(ids) <= remaining:
+                packed.append(chunk)
+                remaining -= len(ids) + separator_len
+            else:
+                if remaining > 0:
+                    packed.append(self.tokenizer.decode(ids[:remaining]) + "...")
+                break
+        
+        return "\n\n".join(packed)
+    
+    def _generate_with_engine(self, prompt, max_length, greedy=False):
+        """Generate the completion of a prompt with the vLLM engine."""
+        from vllm import SamplingParams
+        
+        if greedy:
+            sampling_params = SamplingParams(max_tokens=max_length, temperature=0.0)
+        else:
+            sampling_params = SamplingParams(
+                max_tokens=max_length,
+                temperature=0.7,
+                top_p=0.9,
+                top_k=50
+            )
+        with self.generate_lock:
+            outputs = self.engine.generate([prompt], sampling_params, use_tqdm=False)
+        return outputs[0].outputs[0].text.strip()
+    
+    def _generate_with_model(self, input_ids, max_length, greedy=False, streamer=None):
+        """Generate the completion of prompt token IDs with transformers generate()."""
+        # Move inputs to model's device
+        input_ids = input_ids.to(self.model.device)
+        attention_mask = torch.ones_like(input_ids)
+        
+        # Greedy decoding skips the top-k/top-p filtering over the vocabulary
+        if greedy:
+            sampling_kwargs = {"do_sample": False, "num_beams": 1}
+        else:
+            sampling_kwargs = {"do_sample": True, "temperature": 0.7, "top_p": 0.9, "top_k": 50}
+        
+        # Generate response
+        with self.generate_lock, torch.inference_mode():
+            # Reuse the static KV cache when the generation fits in it
+            cache = self.cache if max_length <= MAX_NEW_TOKENS else None
+            if cache is not None:
+                cache.reset()
             
-            # Add proper language specifier
-            return f"```{language}\n{code}\n```"
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=max_length,
+                past_key_values=cache,
+                use_cache=True,
+                pad_token_id=self.tokenizer.eos_token_id,
+                streamer=streamer,
+                **sampling_kwargs
+            )
         
-        # Replace all code blocks with properly formatted ones
-        formatted_text = re.sub(pattern, format_code, text, flags=re.DOTALL)
-        return formatted_text
+        # Decode only the generated tokens after the prompt
+        return self.tokenizer.decode(outputs[0][input_ids.shape[1]:], skip_special_tokens=True).strip()
+    
+    def _format_code_blocks(self, text):
+        """
+        Format code blocks to ensure proper indentation and structure
+        
+        Args:
+            text (str): Text containing code blocks
+            
+        Returns:
+            str: Text with properly formatted code blocks
+        """
+        return format_code_blocks(text)
     
     def fallback_response(self, query):
         """
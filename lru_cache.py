@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+OpenSim RAG System - LRU Cache
+
+A small thread-safe LRU cache with optional expiry, shared by the web app
+and the LLM helper to reuse embeddings, answers and generated responses.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with a fixed number of entries."""
+    
+    def __init__(self, maxsize, ttl=None):
+        """
+        Initialize the cache
+        
+        Args:
+            maxsize (int): Maximum number of entries before the oldest is evicted
+            ttl (float): Seconds an entry stays valid, or None to never expire
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Return the cached value for key, marking it as recently used."""
+        with self.lock:
+            if key not in self.entries:
+                return default
+            
+            expires, value = self.entries[key]
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                return default
+            
+            self.entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry if full."""
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
@@ -4,24 +4,36 @@ OpenSim RAG System Implementation
 
 This script implements the RAG (Retrieval-Augmented Generation) system for OpenSim.
 It provides a query mechanism to retrieve relevant information from the vector database.
+
+For production, serve it with gunicorn so the index and spaCy model load once
+in the master process and are shared copy-on-write by the workers:
+
+    gunicorn -w 4 --threads 2 --preload rag_system:app --bind 0.0.0.0:5100
 """
 
 import os
 import json
+import mmap
+import functools
 import numpy as np
 import faiss
 import spacy
 from flask import Flask, request, jsonify, render_template, send_from_directory
 import markdown
+from result_pruning import prune_results
 
 # Configuration
 VECTOR_DB_DIR = "./vector_db"
 PROCESSED_DIR = "./processed_data"
 TOP_K = 5  # Number of most relevant chunks to retrieve
+HNSW_EF_SEARCH = 16  # Query-time search depth for the HNSW index
+INDEX_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY  # Share CPU index pages between workers
+SPACY_BATCH_SIZE = 64  # Texts per batch when tokenizing several queries
+SPACY_DISABLED_PIPES = ["tok2vec", "tagger", "parser", "ner", "lemmatizer", "attribute_ruler"]  # Unused pipeline components
 
-# Load spaCy model
-print("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
+def gpu_available():
+    """Check whether FAISS was built with GPU support and can see a GPU."""
+    return hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0
 
 class OpenSimRAG:
     """OpenSim RAG system for answering queries about OpenSim."""
@@ -31,34 +43,68 @@ class OpenSimRAG:
         self.index = None
         self.chunks = None
         self.id_mapping = None
+        self.chunk_texts = None
+        self.chunk_offsets = None
+        self.gpu_resources = None
+        
+        # Load spaCy model. Embeddings only use lexical token attributes and
+        # static vectors, so the statistical components are not loaded.
+        print("Loading spaCy model...")
+        self.nlp = spacy.load("en_core_web_sm", disable=SPACY_DISABLED_PIPES)
+        
         self.load_data()
     
     def load_data(self):
         """Load the vector database and chunks."""
-        # Load FAISS index
+        # Load FAISS index. With a GPU available, the exact flat index is
+        # searched on the GPU; otherwise prefer the HNSW index on the CPU.
         faiss_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_index.bin')
-        if os.path.exists(faiss_index_file):
-            self.index = faiss.read_index(faiss_index_file)
+        hnsw_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_hnsw.bin')
+        if gpu_available() and os.path.exists(faiss_index_file):
+            # Keep the resources alive for as long as the GPU index is in use
+            self.gpu_resources = faiss.StandardGpuResources()
+            self.index = faiss.index_cpu_to_gpu(self.gpu_resources, 0, faiss.read_index(faiss_index_file))
+            print(f"Loaded FAISS GPU index with {self.index.ntotal} vectors")
+        elif os.path.exists(hnsw_index_file):
+            self.index = faiss.read_index(hnsw_index_file, INDEX_IO_FLAGS)
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+            print(f"Loaded FAISS HNSW index with {self.index.ntotal} vectors")
+        elif os.path.exists(faiss_index_file):
+            self.index = faiss.read_index(faiss_index_file, INDEX_IO_FLAGS)
             print(f"Loaded FAISS index with {self.index.ntotal} vectors")
         else:
             print(f"Error: FAISS index file not found at {faiss_index_file}")
             return False
         
-        # Load ID mapping
+        # Load ID mapping, memory-mapping the binary version when present
+        mapping_npy_file = os.path.join(VECTOR_DB_DIR, 'id_mapping.npy')
         mapping_file = os.path.join(VECTOR_DB_DIR, 'id_mapping.json')
-        if os.path.exists(mapping_file):
+        if os.path.exists(mapping_npy_file):
+            self.id_mapping = np.load(mapping_npy_file, mmap_mode='r')
+            print(f"Loaded ID mapping with {len(self.id_mapping)} entries")
+        elif os.path.exists(mapping_file):
             with open(mapping_file, 'r') as f:
-                self.id_mapping = json.load(f)
+                self.id_mapping = np.asarray(json.load(f), dtype=np.int32)
             print(f"Loaded ID mapping with {len(self.id_mapping)} entries")
         else:
             print(f"Error: ID mapping file not found at {mapping_file}")
             return False
         
-        # Load chunks
-        chunks_file = os.path.join(PROCESSED_DIR, 'chunks.json')
-        if os.path.exists(chunks_file):
-            with open(chunks_file, 'r', encoding='utf-8') as f:
+        # Prefer the memory-mapped chunk store, then fall back to chunks.jsonl
+        metadata_file = os.path.join(VECTOR_DB_DIR, 'chunk_metadata.json')
+        texts_file = os.path.join(VECTOR_DB_DIR, 'chunks.bin')
+        offsets_file = os.path.join(VECTOR_DB_DIR, 'offsets.npy')
+        chunks_file = os.path.join(PROCESSED_DIR, 'chunks.jsonl')
+        if all(os.path.exists(path) for path in (metadata_file, texts_file, offsets_file)):
+            with open(metadata_file, 'r', encoding='utf-8') as f:
                 self.chunks = json.load(f)
+            with open(texts_file, 'rb') as f:
+                self.chunk_texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.chunk_offsets = np.load(offsets_file, mmap_mode='r')
+            print(f"Loaded {len(self.chunks)} memory-mapped chunks")
+        elif os.path.exists(chunks_file):
+            with open(chunks_file, 'r', encoding='utf-8') as f:
+                self.chunks = [json.loads(line) for line in f if line.strip()]
             print(f"Loaded {len(self.chunks)} chunks")
         else:
             print(f"Error: Chunks file not found at {chunks_file}")
@@ -66,43 +112,66 @@ class OpenSimRAG:
         
         return True
     
+    def get_chunk_text(self, chunk_id):
+        """Get the text of a chunk, reading it from the mapped store if loaded."""
+        if self.chunk_texts is None:
+            return self.chunks[chunk_id]["chunk_text"]
+        
+        start = int(self.chunk_offsets[chunk_id])
+        end = int(self.chunk_offsets[chunk_id + 1])
+        return self.chunk_texts[start:end].decode('utf-8')
+    
     def get_embedding(self, text):
         """Get embedding vector for a text using spaCy."""
-        # Process with spaCy
-        doc = nlp(text)
+        # Only the tokenizer is needed: lexical attributes and static word
+        # vectors do not depend on the tagger, parser or NER
+        return self.embed_doc(self.nlp.make_doc(text))
+    
+    def get_embeddings(self, texts):
+        """
+        Get embedding vectors for a batch of texts using spaCy
         
+        Args:
+            texts (list): Texts to embed
+            
+        Returns:
+            np.ndarray: (len(texts), 300) float32 embeddings
+        """
+        docs = self.nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE)
+        return np.stack([self.embed_doc(doc) for doc in docs])
+    
+    def embed_doc(self, doc):
+        """Get the normalized embedding vector of a tokenized spaCy doc."""
         # Use spaCy's built-in word vectors
         if doc.vector.any():  # Check if vector is non-zero
             vec = doc.vector
         else:
-            # Create a simple TF-IDF like representation
-            # Count word frequencies
-            word_freq = {}
-            for token in doc:
-                if token.is_alpha and not token.is_stop:
-                    word = token.text.lower()
-                    word_freq[word] = word_freq.get(word, 0) + 1
-            
-            # Create a simple vector (300 dimensions)
-            vec_size = 300
-            vec = np.zeros(vec_size)
+            # Create a simple TF-IDF like representation by hashing each
+            # content word into one of 300 positions and counting, using
+            # spaCy's stable lowercase hash as the index builder does
+            hashes = np.fromiter((token.lower for token in doc if token.is_alpha and not token.is_stop), dtype=np.uint64)
+            vec = np.bincount((hashes % 300).astype(np.int64), minlength=300).astype(np.float32)
+        
+        # Normalize in place so inner product equals cosine similarity
+        vec = np.array(vec, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vec)
+        
+        return vec[0]
+    
+    def query(self, query_text, top_k=TOP_K, min_score=None, max_chunks=None):
+        """
+        Query the RAG system with a question
+        
+        Args:
+            query_text (str): The question
+            top_k (int): Number of nearest chunks to search for
+            min_score (float): Drop hits scoring below this, if given
+            max_chunks (int): Keep at most this many hits, if given
             
-            # Use hash of words to determine vector positions
-            for word, freq in word_freq.items():
-                # Simple hash function to get a position
-                pos = hash(word) % vec_size
-                vec[pos] += freq
-        
-        # Normalize
-        norm = np.linalg.norm(vec)
-        if norm > 0:
-            vec = vec / norm
-        
-        return vec.astype('float32')
-    
-    def query(self, query_text, top_k=TOP_K):
-        """Query the RAG system with a question."""
-        if not self.index or not self.chunks or not self.id_mapping:
+        Returns:
+            dict: The query and its results, best first
+        """
+        if not self.index or not self.chunks or self.id_mapping is None or len(self.id_mapping) == 0:
             return {"error": "RAG system not properly initialized"}
         
         # Get query embedding
@@ -112,9 +181,39 @@ class OpenSimRAG:
         # Search the index
         distances, indices = self.index.search(query_embedding, top_k)
         
-        # Get the chunks
+        # Keep only hits close to the best one, on the index's own distance scale
+        results = prune_results(
+            self.collect_results(distances[0], indices[0]),
+            self.index.metric_type == faiss.METRIC_INNER_PRODUCT,
+            min_score, max_chunks
+        )
+        
+        return {
+            "query": query_text,
+            "results": results
+        }
+    
+    def query_batch(self, query_texts, top_k=TOP_K):
+        """Query the RAG system with several questions in one search call."""
+        if not self.index or not self.chunks or self.id_mapping is None or len(self.id_mapping) == 0:
+            return [{"error": "RAG system not properly initialized"} for _ in query_texts]
+        
+        # Tokenize and embed all queries together, then search them at once
+        query_embeddings = self.get_embeddings(query_texts)
+        distances, indices = self.index.search(query_embeddings, top_k)
+        
+        return [
+            {
+                "query": query_text,
+                "results": self.collect_results(distances[row], indices[row])
+            }
+            for row, query_text in enumerate(query_texts)
+        ]
+    
+    def collect_results(self, distances, indices):
+        """Turn one row of FAISS search output into result dictionaries."""
         results = []
-        for i, idx in enumerate(indices[0]):
+        for i, idx in enumerate(indices):
             if idx < 0 or idx >= len(self.id_mapping):
                 continue
                 
@@ -124,22 +223,34 @@ class OpenSimRAG:
                 
             chunk = self.chunks[chunk_id]
             results.append({
-                "chunk_text": chunk["chunk_text"],
+                "chunk_text": self.get_chunk_text(chunk_id),
                 "source_file": chunk.get("source_file", "Unknown"),
-                "title": chunk.get("Title", "Unknown"),
-                "url": chunk.get("URL", ""),
-                "score": float(1.0 / (1.0 + distances[0][i]))  # Convert distance to score
+                "title": chunk.get("title", chunk.get("Title", "Unknown")),
+                "url": chunk.get("url", chunk.get("URL", "")),
+                "score": self.distance_to_score(distances[i]),
+                "distance": float(distances[i])
             })
         
-        return {
-            "query": query_text,
-            "results": results
-        }
+        return results
+    
+    def distance_to_score(self, distance):
+        """Convert a FAISS distance to a relevance score."""
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return float(distance)  # Already a cosine similarity
+        return float(1.0 / (1.0 + distance))  # Convert L2 distance to score
     
-    def answer_question(self, question):
-        """Answer a question using the RAG system."""
+    def answer_question(self, question, query_result=None):
+        """
+        Answer a question using the RAG system
+        
+        Args:
+            question (str): The question to answer
+            query_result (dict): Retrieval result for the question, if it
+                was already searched as part of a batch
+        """
         # Get relevant chunks
-        query_result = self.query(question)
+        if query_result is None:
+            query_result = self.query(question)
         
         if "error" in query_result:
             return {"error": query_result["error"]}
@@ -170,12 +281,22 @@ class OpenSimRAG:
         }
         
         return answer
+    
+    def answer_questions(self, questions):
+        """Answer several questions, retrieving their chunks in one batch."""
+        query_results = self.query_batch(questions)
+        return [
+            self.answer_question(question, query_result)
+            for question, query_result in zip(questions, query_results)
+        ]
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='./web/static', template_folder='./web/templates')
 
-# Initialize RAG system
-rag_system = OpenSimRAG()
+@functools.lru_cache(maxsize=1)
+def get_rag():
+    """Return the shared RAG system, loading it on first use."""
+    return OpenSimRAG()
 
 @app.route('/')
 def index():
@@ -191,9 +312,21 @@ def api_query():
     if not question:
         return jsonify({"error": "No question provided"})
     
-    result = rag_system.answer_question(question)
+    result = get_rag().answer_question(question)
     return jsonify(result)
 
+@app.route('/api/query_batch', methods=['POST'])
+def api_query_batch():
+    """API endpoint for answering several questions in one request."""
+    data = request.json
+    questions = [question for question in data.get('questions', []) if question]
+    
+    if not questions:
+        return jsonify({"error": "No questions provided"})
+    
+    results = get_rag().answer_questions(questions)
+    return jsonify(results)
+
 @app.route('/static/<path:path>')
 def serve_static(path):
     """Serve static files."""
@@ -202,14 +335,23 @@ def serve_static(path):
 def main():
     """Main function to run the RAG system."""
     print("Starting OpenSim RAG system...")
+    debug = os.environ.get("FLASK_DEBUG") == "1"
     
-    # Check if the system is properly initialized
-    if not rag_system.index or not rag_system.chunks:
-        print("Error: RAG system not properly initialized")
-        return
+    # The debug reloader's parent process only watches files; load the data
+    # in the serving process alone so it is not held twice
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        rag_system = get_rag()
+        
+        # Check if the system is properly initialized
+        if not rag_system.index or not rag_system.chunks:
+            print("Error: RAG system not properly initialized")
+            return
     
     # Run the Flask app
-    app.run(host='0.0.0.0', port=5100, debug=True)
+    app.run(host='0.0.0.0', port=5100, debug=debug)
 
 if __name__ == "__main__":
     main()
+else:
+    # Load at import so gunicorn --preload shares it across workers
+    get_rag()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+OpenSim RAG System - Result Pruning
+
+Drops retrieved chunks that are much further from the query than the best
+hit, so fewer but closer chunks reach the LLM prompt. The cutoff works on
+the raw FAISS distances, since inner-product and L2 indexes use different
+scales.
+"""
+
+IP_SCORE_MARGIN = 0.15  # Keep inner-product hits within this fraction of the best similarity
+L2_DISTANCE_RATIO = 1.5  # Keep L2 hits within this multiple of the nearest distance
+L2_DISTANCE_EPS = 0.05  # Slack added to the L2 cutoff, so an exact match keeps its neighbors
+
+def prune_results(results, inner_product, min_score=None, max_chunks=None):
+    """
+    Drop weak hits so only chunks close to the best one are kept
+    
+    Args:
+        results (list): Query results sorted best first, each with the raw
+            FAISS "distance" and its "score"
+        inner_product (bool): Whether distances are inner products (higher
+            is better) rather than L2 distances (lower is better)
+        min_score (float): Absolute score cutoff, if given
+        max_chunks (int): Maximum number of results to keep, if given
+    
+    Returns:
+        list: The kept results
+    """
+    if not results:
+        return results
+    
+    best = results[0]["distance"]
+    if inner_product:
+        cutoff = best - IP_SCORE_MARGIN * abs(best)
+        kept = [result for result in results if result["distance"] >= cutoff]
+    else:
+        cutoff = best * L2_DISTANCE_RATIO + L2_DISTANCE_EPS
+        kept = [result for result in results if result["distance"] <= cutoff]
+    
+    if min_score is not None:
+        kept = [result for result in kept if result["score"] >= min_score]
+    
+    return kept[:max_chunks] if max_chunks is not None else kept
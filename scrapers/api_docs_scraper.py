@@ -7,17 +7,26 @@ extracting class and function documentation for the RAG system.
 """
 
 import os
+import csv
 import time
 import json
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import asyncio
+import aiohttp
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib.parse import urljoin, urlparse
 
 # Configuration
 BASE_URL = "https://simtk.org/api_docs/opensim/api_docs/"
 OUTPUT_DIR = "../data/api_docs"
-DELAY = 1  # Delay between requests in seconds
+TODAY = time.strftime("%Y-%m-%d")  # Scrape date written into every file and metadata record
+DELAY = 1  # Delay between requests to the same host in seconds
+CONCURRENCY = 8  # Maximum number of pages fetched at once
+METADATA_FIELDS = ["title", "url", "filename", "date_scraped", "content_length"]  # Columns of metadata.csv
+
+# Only build the parts of the DOM that content and link extraction read
+PAGE_STRAINER = SoupStrainer(["div", "title", "a"])
 
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -32,8 +41,10 @@ HEADERS = {
     "Cache-Control": "max-age=0",
 }
 
-# Store metadata about scraped pages
-metadata = []
+# Metadata writers for scraped pages, opened in main()
+metadata_jsonl = None
+metadata_csv = None
+scraped_count = 0
 # Track visited URLs to avoid duplicates
 visited_urls = set()
 
@@ -44,6 +55,13 @@ def clean_filename(filename):
         filename = filename.replace(char, '_')
     return filename.strip()
 
+def record_metadata(record):
+    """Append a scraped page's metadata to the JSONL and CSV files."""
+    global scraped_count
+    metadata_jsonl.write(json.dumps(record) + "\n")
+    metadata_csv.writerow(record)
+    scraped_count += 1
+
 def extract_content(soup):
     """Extract the main content from a BeautifulSoup object."""
     # Find the main content div - this may need adjustment based on the site structure
@@ -51,8 +69,8 @@ def extract_content(soup):
     if not content_div:
         content_div = soup.find("div", {"id": "content"})
     if not content_div:
-        # If specific content div not found, use the body
-        content_div = soup.body
+        # If specific content div not found, use the whole (strained) page
+        content_div = soup.body or soup
     
     # Extract text content
     if content_div:
@@ -60,14 +78,8 @@ def extract_content(soup):
         for script in content_div(["script", "style"]):
             script.decompose()
         
-        # Get text
-        text = content_div.get_text(separator="\n", strip=True)
-        
-        # Clean up text
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        text = "\n\n".join(lines)
-        
-        return text
+        # Get text, one paragraph per text node
+        return "\n\n".join(content_div.stripped_strings)
     
     return ""
 
@@ -89,112 +101,199 @@ def extract_links(soup, base_url):
     
     return links
 
-def scrape_page(url, depth=0, max_depth=3):
-    """Scrape a page and its linked pages up to max_depth."""
-    if depth > max_depth or url in visited_urls:
-        return
+class HostThrottle:
+    """Space out requests to the same host by at least a fixed delay."""
     
-    print(f"Scraping: {url}")
-    visited_urls.add(url)
+    def __init__(self, delay=DELAY):
+        """
+        Initialize the throttle
+        
+        Args:
+            delay (float): Minimum seconds between requests to one host
+        """
+        self.delay = delay
+        self.locks = defaultdict(asyncio.Lock)
+        self.last_request = {}
     
-    try:
-        response = requests.get(url, headers=HEADERS)
+    async def wait(self, url):
+        """Wait until a request to the URL's host is allowed."""
+        host = urlparse(url).netloc
+        async with self.locks[host]:
+            elapsed = time.monotonic() - self.last_request.get(host, 0.0)
+            if elapsed < self.delay:
+                await asyncio.sleep(self.delay - elapsed)
+            self.last_request[host] = time.monotonic()
+
+async def fetch(session, throttle, url):
+    """Fetch the HTML of a page, respecting the per-host delay."""
+    await throttle.wait(url)
+    async with session.get(url) as response:
         response.raise_for_status()
+        return await response.text()
+
+def parse_page(html, url):
+    """
+    Parse a page's HTML
+    
+    Runs in a worker process, so it takes and returns plain values.
+    
+    Args:
+        html (str): The page HTML
+        url (str): The page URL, used to resolve relative links
         
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Extract title
-        title_elem = soup.find("title")
-        title = title_elem.text if title_elem else "Untitled"
-        
-        # Clean title for filename
-        clean_title = clean_filename(title)
-        
-        # Extract content
-        content = extract_content(soup)
-        
-        # Save content to file
-        filename = f"{clean_title}.txt"
-        filepath = os.path.join(OUTPUT_DIR, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(f"Title: {title}\n")
-            f.write(f"URL: {url}\n")
-            f.write(f"Date: {time.strftime('%Y-%m-%d')}\n")
-            f.write("\n")
-            f.write(content)
-        
-        # Add to metadata
-        metadata.append({
-            "title": title,
-            "url": url,
-            "filename": filename,
-            "date_scraped": time.strftime("%Y-%m-%d"),
-            "content_length": len(content)
-        })
-        
-        # Extract links for further scraping
-        links = extract_links(soup, url)
+    Returns:
+        tuple: (title, content, links)
+    """
+    soup = BeautifulSoup(html, "lxml", parse_only=PAGE_STRAINER)
+    
+    # Extract title
+    title_elem = soup.find("title")
+    title = title_elem.text if title_elem else "Untitled"
+    
+    # Extract content and links for further scraping
+    content = extract_content(soup)
+    links = extract_links(soup, url)
+    
+    return title, content, links
+
+def save_page(title, url, content):
+    """Save a page's content to a file and record its metadata."""
+    # Clean title for filename
+    clean_title = clean_filename(title)
+    
+    # Save content to file
+    filename = f"{clean_title}.txt"
+    filepath = os.path.join(OUTPUT_DIR, filename)
+    
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(f"Title: {title}\n")
+        f.write(f"URL: {url}\n")
+        f.write(f"Date: {TODAY}\n")
+        f.write("\n")
+        f.write(content)
+    
+    # Add to metadata
+    record_metadata({
+        "title": title,
+        "url": url,
+        "filename": filename,
+        "date_scraped": TODAY,
+        "content_length": len(content)
+    })
+
+async def scrape_page(session, executor, throttle, url):
+    """Scrape a page and return the links found on it."""
+    print(f"Scraping: {url}")
+    
+    try:
+        html = await fetch(session, throttle, url)
         
-        # Delay to be respectful to the server
-        time.sleep(DELAY)
+        # Parse in a worker process so parsing overlaps with other fetches
+        loop = asyncio.get_running_loop()
+        title, content, links = await loop.run_in_executor(executor, parse_page, html, url)
         
-        # Recursively scrape linked pages
-        for link in links:
-            scrape_page(link, depth + 1, max_depth)
-            
+        save_page(title, url, content)
+        return links
+    
     except Exception as e:
         print(f"Error scraping {url}: {e}")
+        return []
+
+async def crawl(session, executor, throttle, start_urls, max_depth):
+    """
+    Crawl breadth-first from the start URLs with CONCURRENCY workers
+    
+    Args:
+        session (aiohttp.ClientSession): HTTP session
+        executor (ProcessPoolExecutor): Executor for HTML parsing
+        throttle (HostThrottle): Per-host rate limiter
+        start_urls (list): URLs to scrape at depth 0
+        max_depth (int): Maximum link depth to follow
+    """
+    pending = asyncio.Queue()
+    for url in start_urls:
+        pending.put_nowait((url, 0))
+    
+    async def worker():
+        while True:
+            url, depth = await pending.get()
+            try:
+                if depth <= max_depth and url not in visited_urls:
+                    visited_urls.add(url)
+                    links = await scrape_page(session, executor, throttle, url)
+                    
+                    if depth < max_depth:
+                        for link in links:
+                            if link not in visited_urls:
+                                pending.put_nowait((link, depth + 1))
+            finally:
+                pending.task_done()
+    
+    workers = [asyncio.create_task(worker()) for _ in range(CONCURRENCY)]
+    await pending.join()
+    
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+def parse_class_links(html):
+    """Find the links to all class pages in the class list HTML."""
+    soup = BeautifulSoup(html, "lxml", parse_only=SoupStrainer("a", href=True))
+    
+    class_links = []
+    for a_tag in soup.find_all("a", href=True):
+        href = a_tag["href"]
+        if "class" in href and href.endswith(".html"):
+            class_links.append(urljoin(BASE_URL, href))
+    
+    return class_links
 
-def scrape_class_list():
+async def scrape_class_list(session, executor, throttle):
     """Scrape the class list page to get links to all classes."""
     class_list_url = urljoin(BASE_URL, "classes.html")
     
     try:
-        response = requests.get(class_list_url, headers=HEADERS)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, "html.parser")
+        html = await fetch(session, throttle, class_list_url)
         
-        # Find all class links
-        class_links = []
-        for a_tag in soup.find_all("a", href=True):
-            href = a_tag["href"]
-            if "class" in href and href.endswith(".html"):
-                class_links.append(urljoin(BASE_URL, href))
-        
-        return class_links
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, parse_class_links, html)
     
     except Exception as e:
         print(f"Error scraping class list: {e}")
         return []
 
+async def scrape_api_docs():
+    """Scrape the API documentation main page and every class page."""
+    throttle = HostThrottle()
+    
+    async with aiohttp.ClientSession(headers=HEADERS) as session:
+        with ProcessPoolExecutor() as executor:
+            # Scrape the main page
+            await crawl(session, executor, throttle, [BASE_URL], max_depth=1)
+            
+            # Scrape class list
+            class_links = await scrape_class_list(session, executor, throttle)
+            print(f"Found {len(class_links)} classes to scrape.")
+            
+            # Scrape each class page, without following links from them
+            await crawl(session, executor, throttle, class_links, max_depth=0)
+
 def main():
     """Main function to scrape OpenSim API documentation."""
+    global metadata_jsonl, metadata_csv
     print("Starting OpenSim API documentation scraper...")
     
-    # Scrape the main page
-    scrape_page(BASE_URL, max_depth=1)
-    
-    # Scrape class list
-    class_links = scrape_class_list()
-    print(f"Found {len(class_links)} classes to scrape.")
-    
-    # Scrape each class page
-    for link in class_links:
-        scrape_page(link, max_depth=0)  # Don't follow links from class pages
-    
-    # Save metadata
-    metadata_file = os.path.join(OUTPUT_DIR, "metadata.json")
-    with open(metadata_file, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
-    
-    # Create a DataFrame for easier analysis
-    df = pd.DataFrame(metadata)
+    # Stream metadata to disk as pages are scraped instead of collecting
+    # it in memory and writing it at the end
+    metadata_file = os.path.join(OUTPUT_DIR, "metadata.jsonl")
     csv_file = os.path.join(OUTPUT_DIR, "metadata.csv")
-    df.to_csv(csv_file, index=False)
+    with open(metadata_file, "w", encoding="utf-8") as metadata_jsonl, \
+            open(csv_file, "w", encoding="utf-8", newline="") as csv_fp:
+        metadata_csv = csv.DictWriter(csv_fp, fieldnames=METADATA_FIELDS)
+        metadata_csv.writeheader()
+        asyncio.run(scrape_api_docs())
     
-    print(f"\nScraping completed. Scraped {len(metadata)} pages.")
+    print(f"\nScraping completed. Scraped {scraped_count} pages.")
     print(f"Results saved to {OUTPUT_DIR}")
 
 if __name__ == "__main__":
@@ -7,17 +7,26 @@ It navigates through the documentation pages, extracts content, and saves it to
 """
 
 import os
+import csv
 import time
 import json
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import asyncio
+import aiohttp
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib.parse import urljoin, urlparse
 
 # Configuration
 BASE_URL = "https://opensimconfluence.atlassian.net/wiki/spaces/OpenSim"
 OUTPUT_DIR = "../data/confluence_docs"
-DELAY = 1  # Delay between requests in seconds
+TODAY = time.strftime("%Y-%m-%d")  # Scrape date written into every file and metadata record
+DELAY = 1  # Delay between requests to the same host in seconds
+CONCURRENCY = 8  # Maximum number of pages fetched at once
+METADATA_FIELDS = ["title", "url", "filename", "date_scraped", "content_length"]  # Columns of metadata.csv
+
+# Only build the parts of the DOM that content and link extraction read
+PAGE_STRAINER = SoupStrainer(["div", "title", "a"])
 
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -44,8 +53,10 @@ MAIN_SECTIONS = [
 
 # Track visited URLs to avoid duplicates
 visited_urls = set()
-# Store metadata about scraped pages
-metadata = []
+# Metadata writers for scraped pages, opened in main()
+metadata_jsonl = None
+metadata_csv = None
+scraped_count = 0
 
 def clean_filename(filename):
     """Clean a string to make it suitable for a filename."""
@@ -54,6 +65,13 @@ def clean_filename(filename):
         filename = filename.replace(char, '_')
     return filename.strip()
 
+def record_metadata(record):
+    """Append a scraped page's metadata to the JSONL and CSV files."""
+    global scraped_count
+    metadata_jsonl.write(json.dumps(record) + "\n")
+    metadata_csv.writerow(record)
+    scraped_count += 1
+
 def extract_content(soup):
     """Extract the main content from a BeautifulSoup object."""
     # Find the main content div - this may need adjustment based on the site structure
@@ -61,8 +79,8 @@ def extract_content(soup):
     if not content_div:
         content_div = soup.find("div", {"class": "wiki-content"})
     if not content_div:
-        # If specific content div not found, use the body
-        content_div = soup.body
+        # If specific content div not found, use the whole (strained) page
+        content_div = soup.body or soup
     
     # Extract text content
     if content_div:
@@ -70,14 +88,8 @@ def extract_content(soup):
         for script in content_div(["script", "style"]):
             script.decompose()
         
-        # Get text
-        text = content_div.get_text(separator="\n", strip=True)
-        
-        # Clean up text
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        text = "\n\n".join(lines)
-        
-        return text
+        # Get text, one paragraph per text node
+        return "\n\n".join(content_div.stripped_strings)
     
     return ""
 
@@ -99,130 +111,189 @@ def extract_links(soup, base_url):
     
     return links
 
-def scrape_page(url, depth=0, max_depth=3):
-    """Scrape a page and its linked pages up to max_depth."""
-    if depth > max_depth or url in visited_urls:
-        return
+class HostThrottle:
+    """Space out requests to the same host by at least a fixed delay."""
     
-    print(f"Scraping: {url}")
-    visited_urls.add(url)
+    def __init__(self, delay=DELAY):
+        """
+        Initialize the throttle
+        
+        Args:
+            delay (float): Minimum seconds between requests to one host
+        """
+        self.delay = delay
+        self.locks = defaultdict(asyncio.Lock)
+        self.last_request = {}
     
-    try:
-        response = requests.get(url, headers=HEADERS)
+    async def wait(self, url):
+        """Wait until a request to the URL's host is allowed."""
+        host = urlparse(url).netloc
+        async with self.locks[host]:
+            elapsed = time.monotonic() - self.last_request.get(host, 0.0)
+            if elapsed < self.delay:
+                await asyncio.sleep(self.delay - elapsed)
+            self.last_request[host] = time.monotonic()
+
+async def fetch(session, throttle, url):
+    """Fetch the HTML of a page, respecting the per-host delay."""
+    await throttle.wait(url)
+    async with session.get(url) as response:
         response.raise_for_status()
+        return await response.text()
+
+def parse_page(html, url):
+    """
+    Parse a page's HTML
+    
+    Runs in a worker process, so it takes and returns plain values.
+    
+    Args:
+        html (str): The page HTML
+        url (str): The page URL, used to resolve relative links
         
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Extract title
-        title_elem = soup.find("title")
-        title = title_elem.text if title_elem else "Untitled"
-        
-        # Clean title for filename
-        clean_title = clean_filename(title)
-        
-        # Extract content
-        content = extract_content(soup)
-        
-        # Save content to file
-        filename = f"{clean_title}.txt"
-        filepath = os.path.join(OUTPUT_DIR, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(f"Title: {title}\n")
-            f.write(f"URL: {url}\n")
-            f.write(f"Date: {time.strftime('%Y-%m-%d')}\n")
-            f.write("\n")
-            f.write(content)
-        
-        # Add to metadata
-        metadata.append({
-            "title": title,
-            "url": url,
-            "filename": filename,
-            "date_scraped": time.strftime("%Y-%m-%d"),
-            "content_length": len(content)
-        })
-        
-        # Extract links for further scraping
-        links = extract_links(soup, url)
-        
-        # Delay to be respectful to the server
-        time.sleep(DELAY)
-        
-        # Recursively scrape linked pages
-        for link in links:
-            scrape_page(link, depth + 1, max_depth)
-            
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
+    Returns:
+        tuple: (title, content, links)
+    """
+    soup = BeautifulSoup(html, "lxml", parse_only=PAGE_STRAINER)
+    
+    # Extract title
+    title_elem = soup.find("title")
+    title = title_elem.text if title_elem else "Untitled"
+    
+    # Extract content and links for further scraping
+    content = extract_content(soup)
+    links = extract_links(soup, url)
+    
+    return title, content, links
 
-def main():
-    """Main function to scrape OpenSim documentation."""
-    print("Starting OpenSim documentation scraper...")
+def save_page(title, url, content, filename=None):
+    """Save a page's content to a file and record its metadata."""
+    # Clean title for filename
+    if filename is None:
+        filename = f"{clean_filename(title)}.txt"
+    
+    # Save content to file
+    filepath = os.path.join(OUTPUT_DIR, filename)
+    
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(f"Title: {title}\n")
+        f.write(f"URL: {url}\n")
+        f.write(f"Date: {TODAY}\n")
+        f.write("\n")
+        f.write(content)
+    
+    # Add to metadata
+    record_metadata({
+        "title": title,
+        "url": url,
+        "filename": filename,
+        "date_scraped": TODAY,
+        "content_length": len(content)
+    })
+
+async def scrape_page(session, executor, throttle, url):
+    """Scrape a page and return the links found on it."""
+    print(f"Scraping: {url}")
     
-    # Try to scrape the main documentation page first
-    main_url = "https://opensim.stanford.edu/"
-    print(f"Scraping main page: {main_url}")
     try:
-        response = requests.get(main_url, headers=HEADERS)
-        response.raise_for_status()
+        html = await fetch(session, throttle, url)
         
-        soup = BeautifulSoup(response.text, "html.parser")
+        # Parse in a worker process so parsing overlaps with other fetches
+        loop = asyncio.get_running_loop()
+        title, content, links = await loop.run_in_executor(executor, parse_page, html, url)
         
-        # Extract title and content
-        title = "OpenSim Main Page"
-        content = extract_content(soup)
-        
-        # Save content to file
-        filename = "OpenSim_Main_Page.txt"
-        filepath = os.path.join(OUTPUT_DIR, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(f"Title: {title}\n")
-            f.write(f"URL: {main_url}\n")
-            f.write(f"Date: {time.strftime('%Y-%m-%d')}\n")
-            f.write("\n")
-            f.write(content)
-        
-        # Add to metadata
-        metadata.append({
-            "title": title,
-            "url": main_url,
-            "filename": filename,
-            "date_scraped": time.strftime("%Y-%m-%d"),
-            "content_length": len(content)
-        })
-        
-        # Extract links for further scraping
-        links = extract_links(soup, main_url)
-        
-        # Scrape linked pages
-        for link in links:
-            if "opensim.stanford.edu" in link:
-                scrape_page(link, max_depth=1)
+        save_page(title, url, content)
+        return links
     
     except Exception as e:
-        print(f"Error scraping main page: {e}")
+        print(f"Error scraping {url}: {e}")
+        return []
+
+async def crawl(session, executor, throttle, start_urls, max_depth):
+    """
+    Crawl breadth-first from the start URLs with CONCURRENCY workers
     
-    # Try to scrape the documentation site
-    doc_url = "https://opensimconfluence.atlassian.net/wiki/spaces/OpenSim/overview"
-    print(f"Scraping documentation page: {doc_url}")
-    try:
-        scrape_page(doc_url, max_depth=2)
-    except Exception as e:
-        print(f"Error scraping documentation page: {e}")
+    Args:
+        session (aiohttp.ClientSession): HTTP session
+        executor (ProcessPoolExecutor): Executor for HTML parsing
+        throttle (HostThrottle): Per-host rate limiter
+        start_urls (list): URLs to scrape at depth 0
+        max_depth (int): Maximum link depth to follow
+    """
+    pending = asyncio.Queue()
+    for url in start_urls:
+        pending.put_nowait((url, 0))
+    
+    async def worker():
+        while True:
+            url, depth = await pending.get()
+            try:
+                if depth <= max_depth and url not in visited_urls:
+                    visited_urls.add(url)
+                    links = await scrape_page(session, executor, throttle, url)
+                    
+                    if depth < max_depth:
+                        for link in links:
+                            if link not in visited_urls:
+                                pending.put_nowait((link, depth + 1))
+            finally:
+                pending.task_done()
+    
+    workers = [asyncio.create_task(worker()) for _ in range(CONCURRENCY)]
+    await pending.join()
     
-    # Save metadata
-    metadata_file = os.path.join(OUTPUT_DIR, "metadata.json")
-    with open(metadata_file, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+async def scrape_documentation():
+    """Scrape the OpenSim main page and the Confluence documentation."""
+    throttle = HostThrottle()
+    
+    async with aiohttp.ClientSession(headers=HEADERS) as session:
+        with ProcessPoolExecutor() as executor:
+            loop = asyncio.get_running_loop()
+            
+            # Try to scrape the main documentation page first
+            main_url = "https://opensim.stanford.edu/"
+            print(f"Scraping main page: {main_url}")
+            try:
+                html = await fetch(session, throttle, main_url)
+                _, content, links = await loop.run_in_executor(executor, parse_page, html, main_url)
+                
+                save_page("OpenSim Main Page", main_url, content, filename="OpenSim_Main_Page.txt")
+                
+                # Scrape linked pages
+                site_links = [link for link in links if "opensim.stanford.edu" in link]
+                await crawl(session, executor, throttle, site_links, max_depth=1)
+            
+            except Exception as e:
+                print(f"Error scraping main page: {e}")
+            
+            # Try to scrape the documentation site
+            doc_url = "https://opensimconfluence.atlassian.net/wiki/spaces/OpenSim/overview"
+            print(f"Scraping documentation page: {doc_url}")
+            try:
+                await crawl(session, executor, throttle, [doc_url], max_depth=2)
+            except Exception as e:
+                print(f"Error scraping documentation page: {e}")
+
+def main():
+    """Main function to scrape OpenSim documentation."""
+    global metadata_jsonl, metadata_csv
+    print("Starting OpenSim documentation scraper...")
     
-    # Create a DataFrame for easier analysis
-    df = pd.DataFrame(metadata)
+    # Stream metadata to disk as pages are scraped instead of collecting
+    # it in memory and writing it at the end
+    metadata_file = os.path.join(OUTPUT_DIR, "metadata.jsonl")
     csv_file = os.path.join(OUTPUT_DIR, "metadata.csv")
-    df.to_csv(csv_file, index=False)
+    with open(metadata_file, "w", encoding="utf-8") as metadata_jsonl, \
+            open(csv_file, "w", encoding="utf-8", newline="") as csv_fp:
+        metadata_csv = csv.DictWriter(csv_fp, fieldnames=METADATA_FIELDS)
+        metadata_csv.writeheader()
+        asyncio.run(scrape_documentation())
     
-    print(f"\nScraping completed. Scraped {len(metadata)} pages.")
+    print(f"\nScraping completed. Scraped {scraped_count} pages.")
     print(f"Results saved to {OUTPUT_DIR}")
 
 if __name__ == "__main__":
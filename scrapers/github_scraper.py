@@ -7,19 +7,40 @@ focusing on documentation files, README files, and other relevant content.
 """
 
 import os
+import re
+import csv
 import time
 import json
-import requests
+import asyncio
+import aiohttp
 import base64
-import pandas as pd
 from urllib.parse import urljoin
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Decode API responses with orjson's C parser when it is installed
+json_loads = orjson.loads if orjson is not None else json.loads
+
 # Configuration
 OUTPUT_DIR = "../data/github_docs"
+TODAY = time.strftime("%Y-%m-%d")  # Scrape date written into every file and metadata record
+BLOB_CACHE_DIR = os.path.join(OUTPUT_DIR, "blob_cache")  # Decoded blobs stored by SHA
+METADATA_LOG = os.path.join(OUTPUT_DIR, "metadata.jsonl")  # Append-only metadata log kept across runs
+METADATA_BUFFER_SIZE = 1 << 16  # Write buffer of the metadata log in bytes
 DELAY = 1  # Delay between requests in seconds
+MAX_CONNECTIONS = 20  # Size of the pooled keep-alive connection pool
+KEEPALIVE_TIMEOUT = 60  # Seconds an idle pooled connection is kept open
+MAX_CONCURRENT_READS = 8  # Maximum number of API requests in flight at once
+RATE_LIMIT_FLOOR = 500  # Requests kept in reserve before pausing until the limit resets
+MAX_RETRIES = 3  # Retries of a request rejected by a secondary rate limit
+WRITE_BATCH_SIZE = 64  # Maximum number of queued files written in one batch
 
-# Create output directory if it doesn't exist
+# Create output directories if they don't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(BLOB_CACHE_DIR, exist_ok=True)
 
 # GitHub API endpoints
 GITHUB_API = "https://api.github.com"
@@ -36,98 +57,290 @@ HEADERS = {
     "User-Agent": "OpenSim-RAG-Project"
 }
 
+# Authenticated requests get 5000 requests/hour instead of 60
+GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
+if GITHUB_TOKEN:
+    HEADERS["Authorization"] = f"Bearer {GITHUB_TOKEN}"
+else:
+    print("GITHUB_TOKEN not set, using the unauthenticated rate limit")
+
 # File extensions and names to focus on
 DOC_EXTENSIONS = ['.md', '.txt', '.rst', '.ipynb']
 DOC_FILENAMES = ['readme', 'contributing', 'documentation', 'guide', 'tutorial', 'example', 'howto', 'faq']
+DOC_EXTENSION_SET = frozenset(DOC_EXTENSIONS)
+DOC_FILENAME_RE = re.compile("|".join(map(re.escape, DOC_FILENAMES)), re.IGNORECASE)
 
-# Store metadata about scraped files
-metadata = []
+# Append-only metadata log, opened in main(), and the version (blob SHA or
+# issue update time) of every URL it already holds
+metadata_log = None
+recorded_versions = {}
+recorded_count = 0
+# Caps concurrent API reads; created in scrape_repos() inside the event loop
+read_limit = None
+# (filepath, text) pairs waiting for file_writer(); created in scrape_repos()
+write_queue = None
+
+class RateLimitReservoir:
+    """Track the remaining GitHub rate limit and pause before it runs out."""
+    
+    def __init__(self, floor=RATE_LIMIT_FLOOR):
+        """
+        Initialize the reservoir
+        
+        Args:
+            floor (int): Requests to keep in reserve, capped at a tenth of the limit
+        """
+        self.floor = floor
+        self.reservoir = None  # Unknown until the first response
+        self.reset_time = 0.0
+    
+    async def wait(self):
+        """Wait for the rate limit to reset if the reservoir is empty."""
+        if self.reservoir is not None and self.reservoir <= 0:
+            delay = self.reset_time - time.time()
+            if delay > 0:
+                print(f"Rate limit reserve reached, pausing {delay:.0f}s until reset")
+                await asyncio.sleep(delay)
+            self.reservoir = None
+    
+    def update(self, headers):
+        """Update the reservoir from a response's rate limit headers."""
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        
+        limit = int(headers.get("X-RateLimit-Limit", 0))
+        floor = min(self.floor, limit // 10)
+        self.reservoir = max(0, int(headers["X-RateLimit-Remaining"]) - floor)
+        self.reset_time = float(headers.get("X-RateLimit-Reset", 0))
+
+rate_limit = RateLimitReservoir()
 
 def is_documentation_file(filename):
     """Check if a file is likely to be documentation."""
-    filename_lower = filename.lower()
-    
     # Check extensions
-    if any(filename_lower.endswith(ext) for ext in DOC_EXTENSIONS):
+    if os.path.splitext(filename)[1].lower() in DOC_EXTENSION_SET:
         return True
     
     # Check filenames
-    if any(doc_name in filename_lower for doc_name in DOC_FILENAMES):
-        return True
+    return DOC_FILENAME_RE.search(filename) is not None
+
+def create_session():
+    """Create an HTTP session that keeps connections to the API alive."""
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS)
+
+async def api_get(session, url, params=None, headers=None):
+    """
+    GET a GitHub API URL, waiting for a free read slot first
+    
+    Args:
+        session (aiohttp.ClientSession): HTTP session
+        url (str): API URL
+        params (dict): Query string parameters
+        headers (dict): Extra request headers
+        
+    Returns:
+        tuple: (HTTP status, decoded JSON body or None, response headers)
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        await rate_limit.wait()
+        
+        async with read_limit:
+            async with session.get(url, params=params, headers=headers) as response:
+                rate_limit.update(response.headers)
+                
+                if response.status == 200:
+                    return response.status, json_loads(await response.read()), response.headers
+                
+                # Back off as told when a secondary rate limit rejects the request
+                retry_after = response.headers.get("Retry-After")
+                if response.status not in (403, 429) or retry_after is None or attempt == MAX_RETRIES:
+                    return response.status, None, response.headers
+        
+        print(f"Rate limited on {url}, retrying in {retry_after}s")
+        await asyncio.sleep(float(retry_after))
+
+async def get_repo_tree(session, repo):
+    """
+    List every file in a repository's default branch with the Git Trees API
     
-    return False
+    Args:
+        session (aiohttp.ClientSession): HTTP session
+        repo (str): Repository name as "owner/name"
+        
+    Returns:
+        tuple: (branch name, list of blob entries with "path" and "sha")
+    """
+    url = f"{GITHUB_API}/repos/{repo}"
+    status, repo_data, _ = await api_get(session, url)
+    if status != 200:
+        print(f"Error fetching {url}: {status}")
+        return None, []
+    
+    # One recursive tree request replaces a contents request per directory
+    branch = repo_data["default_branch"]
+    url = f"{GITHUB_API}/repos/{repo}/git/trees/{branch}"
+    status, tree_data, _ = await api_get(session, url, {"recursive": "1"})
+    if status != 200:
+        print(f"Error fetching {url}: {status}")
+        return branch, []
+    
+    if tree_data.get("truncated"):
+        print(f"Warning: file tree of {repo} is truncated by the API")
+    
+    return branch, [entry for entry in tree_data["tree"] if entry["type"] == "blob"]
 
-def get_repo_contents(repo, path=""):
-    """Get contents of a repository at a specific path."""
-    url = f"{GITHUB_API}/repos/{repo}/contents/{path}"
-    response = requests.get(url, headers=HEADERS)
+def load_metadata():
+    """
+    Load the latest record of every URL in the metadata log
     
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error fetching {url}: {response.status_code}")
+    A record appended for a changed file replaces the earlier one for the
+    same URL, keeping its position.
+    """
+    if not os.path.exists(METADATA_LOG):
         return []
+    
+    records = {}
+    with open(METADATA_LOG, "rb") as f:
+        for line in f:
+            if line.strip():
+                record = json_loads(line)
+                records[record["url"]] = record
+    return list(records.values())
+
+def is_recorded(url, version):
+    """Check whether the metadata log already holds this version of a URL."""
+    return recorded_versions.get(url) == version
 
-def get_file_content(repo, path):
-    """Get content of a specific file in a repository."""
-    url = f"{GITHUB_API}/repos/{repo}/contents/{path}"
-    response = requests.get(url, headers=HEADERS)
+def record_metadata(record, version):
+    """Append a metadata record to the log unless this version of its URL is already recorded."""
+    global recorded_count
+    if is_recorded(record["url"], version):
+        return
     
-    if response.status_code == 200:
-        content_data = response.json()
+    if orjson is not None:
+        metadata_log.write(orjson.dumps(record).decode("utf-8") + "\n")
+    else:
+        metadata_log.write(json.dumps(record) + "\n")
+    recorded_versions[record["url"]] = version
+    recorded_count += 1
+
+def compact_metadata(metadata):
+    """Rewrite the metadata log with only the latest record of every URL."""
+    with open(METADATA_LOG + ".tmp", "w", encoding="utf-8") as f:
+        for record in metadata:
+            f.write(json.dumps(record) + "\n")
+    os.replace(METADATA_LOG + ".tmp", METADATA_LOG)
+
+def write_files(items):
+    """Write a batch of (filepath, text) pairs to disk."""
+    for filepath, text in items:
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(text)
+
+async def file_writer():
+    """
+    Drain write_queue until it receives None, writing files in batches
+    
+    Disk writes run in a worker thread so fetches on the event loop
+    never wait on them.
+    """
+    done = False
+    while not done:
+        items = [await write_queue.get()]
+        while len(items) < WRITE_BATCH_SIZE and not write_queue.empty():
+            items.append(write_queue.get_nowait())
+        
+        if items[-1] is None:
+            items.pop()
+            done = True
+        
+        await asyncio.to_thread(write_files, items)
+
+def get_output_path(repo, path):
+    """Get the filename and output path a repository file is saved under."""
+    filename = f"{repo.replace('/', '_')}_{path.replace('/', '_')}"
+    return filename, os.path.join(OUTPUT_DIR, filename)
+
+async def get_file_content(session, repo, sha):
+    """
+    Get content of a specific file in a repository from its blob
+    
+    Blobs are immutable and named by their SHA, so a blob already in
+    the local cache is read from disk without any request, and only
+    new or changed files are downloaded.
+    """
+    cache_path = os.path.join(BLOB_CACHE_DIR, sha)
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+    
+    url = f"{GITHUB_API}/repos/{repo}/git/blobs/{sha}"
+    status, content_data, _ = await api_get(session, url)
+    
+    if status == 200:
         if content_data.get("encoding") == "base64" and content_data.get("content"):
-            return base64.b64decode(content_data["content"]).decode('utf-8')
+            content = base64.b64decode(content_data["content"]).decode('utf-8')
+            await write_queue.put((cache_path, content))
+            return content
     
     return None
 
-def process_repo_contents(repo, path="", depth=0, max_depth=5):
-    """Process contents of a repository recursively."""
-    if depth > max_depth:
-        return
+async def process_repo_contents(session, repo, max_depth=5):
+    """Process the documentation files of a repository, fetching them concurrently."""
+    branch, blobs = await get_repo_tree(session, repo)
     
-    contents = get_repo_contents(repo, path)
+    tasks = []
+    for blob in blobs:
+        path = blob["path"]
+        if path.count("/") <= max_depth and is_documentation_file(os.path.basename(path)):
+            item = {
+                "path": path,
+                "sha": blob["sha"],
+                "html_url": f"https://github.com/{repo}/blob/{branch}/{path}"
+            }
+            tasks.append(process_repo_file(session, repo, item))
     
-    if not isinstance(contents, list):
-        # Handle case where contents is not a list (e.g., it's a file)
+    # Files are fetched together, bounded by read_limit
+    await asyncio.gather(*tasks)
+
+async def process_repo_file(session, repo, item):
+    """Fetch a documentation file and save it with its metadata."""
+    filename, filepath = get_output_path(repo, item["path"])
+    
+    # Skip files saved by an earlier run whose blob has not changed since
+    if is_recorded(item["html_url"], item["sha"]) and os.path.exists(filepath):
         return
     
-    for item in contents:
-        if item["type"] == "dir":
-            # Process directory recursively
-            process_repo_contents(repo, item["path"], depth + 1, max_depth)
-        elif item["type"] == "file" and is_documentation_file(item["name"]):
-            # Process documentation file
-            print(f"Processing file: {item['path']}")
-            content = get_file_content(repo, item["path"])
-            
-            if content:
-                # Create filename
-                filename = f"{repo.replace('/', '_')}_{item['path'].replace('/', '_')}"
-                filepath = os.path.join(OUTPUT_DIR, filename)
-                
-                # Save content to file
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(f"Repository: {repo}\n")
-                    f.write(f"Path: {item['path']}\n")
-                    f.write(f"URL: {item['html_url']}\n")
-                    f.write(f"Date: {time.strftime('%Y-%m-%d')}\n")
-                    f.write("\n")
-                    f.write(content)
-                
-                # Add to metadata
-                metadata.append({
-                    "repository": repo,
-                    "path": item["path"],
-                    "url": item["html_url"],
-                    "filename": filename,
-                    "date_scraped": time.strftime("%Y-%m-%d"),
-                    "content_length": len(content)
-                })
-            
-            # Delay to be respectful to the API rate limits
-            time.sleep(DELAY)
-
-def get_repo_issues(repo, state="open", per_page=100, max_pages=5):
+    print(f"Processing file: {item['path']}")
+    content = await get_file_content(session, repo, item["sha"])
+    
+    if content:
+        # Queue content for the file writer
+        header = (
+            f"Repository: {repo}\n"
+            f"Path: {item['path']}\n"
+            f"URL: {item['html_url']}\n"
+            f"Date: {TODAY}\n"
+            "\n"
+        )
+        await write_queue.put((filepath, header + content))
+        
+        # Add to metadata
+        record_metadata({
+            "repository": repo,
+            "path": item["path"],
+            "url": item["html_url"],
+            "sha": item["sha"],
+            "filename": filename,
+            "date_scraped": TODAY,
+            "content_length": len(content)
+        }, item["sha"])
+    
+    # Delay to be respectful to the API rate limits
+    await asyncio.sleep(DELAY)
+
+async def get_repo_issues(session, repo, state="open", per_page=100, max_pages=5):
     """Get issues from a repository."""
     issues = []
     
@@ -139,26 +352,24 @@ def get_repo_issues(repo, state="open", per_page=100, max_pages=5):
             "page": page
         }
         
-        response = requests.get(url, headers=HEADERS, params=params)
-        
-        if response.status_code == 200:
-            page_issues = response.json()
-            if not page_issues:
-                break
-            
-            issues.extend(page_issues)
-            time.sleep(DELAY)
-        else:
-            print(f"Error fetching issues for {repo}: {response.status_code}")
+        status, page_issues, _ = await api_get(session, url, params)
+        if status != 200:
+            print(f"Error fetching issues for {repo}: {status}")
+            break
+        
+        if not page_issues:
             break
+        
+        issues.extend(page_issues)
+        await asyncio.sleep(DELAY)
     
     return issues
 
-def process_repo_issues(repo):
+async def process_repo_issues(session, repo):
     """Process issues from a repository."""
     print(f"Processing issues for {repo}")
     
-    issues = get_repo_issues(repo)
+    issues = await get_repo_issues(session, repo)
     
     for issue in issues:
         # Create filename
@@ -171,55 +382,95 @@ def process_repo_issues(repo):
         body = issue["body"] or ""
         url = issue["html_url"]
         created_at = issue["created_at"]
+        updated_at = issue["updated_at"]
         
-        # Save content to file
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(f"Repository: {repo}\n")
-            f.write(f"Issue: #{issue_number}\n")
-            f.write(f"Title: {title}\n")
-            f.write(f"URL: {url}\n")
-            f.write(f"Created: {created_at}\n")
-            f.write(f"Date Scraped: {time.strftime('%Y-%m-%d')}\n")
-            f.write("\n")
-            f.write(body)
+        # Skip issues saved by an earlier run that have not changed since
+        if is_recorded(url, updated_at) and os.path.exists(filepath):
+            continue
+        
+        # Queue content for the file writer
+        header = (
+            f"Repository: {repo}\n"
+            f"Issue: #{issue_number}\n"
+            f"Title: {title}\n"
+            f"URL: {url}\n"
+            f"Created: {created_at}\n"
+            f"Date Scraped: {TODAY}\n"
+            "\n"
+        )
+        await write_queue.put((filepath, header + body))
         
         # Add to metadata
-        metadata.append({
+        record_metadata({
             "repository": repo,
             "type": "issue",
             "number": issue_number,
             "title": title,
             "url": url,
             "created_at": created_at,
+            "updated_at": updated_at,
             "filename": filename,
-            "date_scraped": time.strftime("%Y-%m-%d"),
+            "date_scraped": TODAY,
             "content_length": len(body)
-        })
+        }, updated_at)
+
+async def process_repo(session, repo):
+    """Process the contents and issues of one repository."""
+    print(f"\nProcessing repository: {repo}")
+    
+    # Process repository contents and issues
+    await asyncio.gather(
+        process_repo_contents(session, repo),
+        process_repo_issues(session, repo)
+    )
+
+async def scrape_repos():
+    """Scrape the contents and issues of every repository over one session."""
+    global read_limit, write_queue
+    read_limit = asyncio.Semaphore(MAX_CONCURRENT_READS)
+    write_queue = asyncio.Queue()
+    writer = asyncio.create_task(file_writer())
+    
+    async with create_session() as session:
+        await asyncio.gather(*(process_repo(session, repo) for repo in REPOS))
+    
+    # Flush the remaining queued files
+    await write_queue.put(None)
+    await writer
 
 def main():
     """Main function to scrape OpenSim GitHub repositories."""
+    global metadata_log
     print("Starting OpenSim GitHub repository scraper...")
     
-    for repo in REPOS:
-        print(f"\nProcessing repository: {repo}")
-        
-        # Process repository contents
-        process_repo_contents(repo)
-        
-        # Process repository issues
-        process_repo_issues(repo)
+    # Append new records to the log from earlier runs as they are scraped,
+    # so a crash keeps everything recorded so far
+    recorded_versions.update(
+        (record["url"], record.get("sha", record.get("updated_at"))) for record in load_metadata()
+    )
+    with open(METADATA_LOG, "a", encoding="utf-8", buffering=METADATA_BUFFER_SIZE) as metadata_log:
+        asyncio.run(scrape_repos())
     
-    # Save metadata
+    # Drop the records replaced by this run, then convert the log to JSON and CSV once
+    metadata = load_metadata()
+    compact_metadata(metadata)
     metadata_file = os.path.join(OUTPUT_DIR, "metadata.json")
-    with open(metadata_file, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+    if orjson is not None:
+        with open(metadata_file, "wb") as f:
+            f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    else:
+        with open(metadata_file, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
     
-    # Create a DataFrame for easier analysis
-    df = pd.DataFrame(metadata)
+    # Write a CSV for easier analysis, with every key any record has as a column
+    fieldnames = list(dict.fromkeys(key for record in metadata for key in record))
     csv_file = os.path.join(OUTPUT_DIR, "metadata.csv")
-    df.to_csv(csv_file, index=False)
+    with open(csv_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(metadata)
     
-    print(f"\nScraping completed. Scraped {len(metadata)} files.")
+    print(f"\nScraping completed. Recorded {recorded_count} new or updated items, {len(metadata)} in total.")
     print(f"Results saved to {OUTPUT_DIR}")
 
 if __name__ == "__main__":
@@ -13,11 +13,13 @@ import json
 import subprocess
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration
 DATA_DIR = "../data"
 LOG_DIR = "../logs"
 SCRAPERS_DIR = "scrapers"
+OUTPUT_CHUNK_SIZE = 65536  # Bytes of scraper output read and logged at a time
 
 # Create directories if they don't exist
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -49,22 +51,26 @@ def run_scraper(scraper):
     
     try:
         # Run the scraper and capture output
-        with open(log_file, "w") as f:
-            f.write(f"Running {name} ({script}) at {timestamp}\n\n")
+        with open(log_file, "wb") as f:
+            f.write(f"Running {name} ({script}) at {timestamp}\n\n".encode("utf-8"))
             
             process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1
+                stderr=subprocess.STDOUT
             )
             
-            # Stream and log output
-            for line in process.stdout:
-                print(line, end="")
-                f.write(line)
+            # Stream and log raw output in large chunks rather than line by line
+            fd = process.stdout.fileno()
+            while True:
+                chunk = os.read(fd, OUTPUT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+                f.write(chunk)
             
+            process.stdout.close()
             process.wait()
             
             if process.returncode == 0:
@@ -74,7 +80,7 @@ def run_scraper(scraper):
             
             end_message = f"\n\n{name} completed with status: {status}"
             print(end_message)
-            f.write(end_message)
+            f.write(end_message.encode("utf-8"))
         
         return process.returncode == 0
     
@@ -102,12 +108,19 @@ def collect_metadata():
     ]
     
     for directory in metadata_dirs:
+        # Scrapers stream metadata to JSONL; older ones write a JSON list
+        jsonl_file = os.path.join(directory, "metadata.jsonl")
         metadata_file = os.path.join(directory, "metadata.json")
+        if os.path.exists(jsonl_file):
+            metadata_file = jsonl_file
         
         if os.path.exists(metadata_file):
             try:
                 with open(metadata_file, "r", encoding="utf-8") as f:
-                    metadata = json.load(f)
+                    if metadata_file == jsonl_file:
+                        metadata = [json.loads(line) for line in f if line.strip()]
+                    else:
+                        metadata = json.load(f)
                 
                 # Add source information
                 source = os.path.basename(directory)
@@ -138,19 +151,21 @@ def main():
     start_time = time.time()
     print(f"Starting OpenSim scraper runner at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    results = []
-    
-    # Run each enabled scraper
+    enabled = [scraper for scraper in SCRAPERS if scraper["enabled"]]
     for scraper in SCRAPERS:
-        if scraper["enabled"]:
-            success = run_scraper(scraper)
-            results.append({
-                "name": scraper["name"],
-                "success": success
-            })
-        else:
+        if not scraper["enabled"]:
             print(f"Skipping disabled scraper: {scraper['name']}")
     
+    # Run the enabled scrapers at the same time; each one targets a different host
+    results = []
+    if enabled:
+        with ThreadPoolExecutor(max_workers=len(enabled)) as executor:
+            for scraper, success in zip(enabled, executor.map(run_scraper, enabled)):
+                results.append({
+                    "name": scraper["name"],
+                    "success": success
+                })
+    
     # Collect and combine metadata
     metadata = collect_metadata()
     
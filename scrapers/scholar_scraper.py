@@ -7,18 +7,25 @@ from Google Scholar and other academic sources.
 """
 
 import os
+import csv
 import time
 import json
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import hashlib
+import asyncio
+import aiohttp
+from lxml import etree, html as lxml_html
 import re
 from urllib.parse import urljoin, quote_plus
 
 # Configuration
 OUTPUT_DIR = "../data/papers"
+TODAY = time.strftime("%Y-%m-%d")  # Scrape date written into every file and metadata record
 DELAY = 3  # Delay between requests in seconds (higher for academic sites)
 MAX_PAPERS = 100  # Maximum number of papers to collect
+MAX_CONCURRENT_DOWNLOADS = 4  # Maximum number of PDFs downloaded at once
+DOWNLOAD_CHUNK_SIZE = 65536  # Bytes read and written per PDF chunk
+METADATA_LOG = os.path.join(OUTPUT_DIR, "metadata.jsonl")  # Append-only metadata log kept across runs
+METADATA_BUFFER_SIZE = 1 << 16  # Write buffer of the metadata log in bytes
 
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -42,8 +49,24 @@ SEARCH_QUERIES = [
     "OpenSim Stanford biomechanics"
 ]
 
-# Store metadata about scraped papers
-metadata = []
+def class_xpath(*classes):
+    """Build an XPath predicate matching elements that have all the given classes."""
+    return " and ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')" for cls in classes
+    )
+
+# Compiled XPath equivalents of the result page's CSS selectors
+RESULT_XPATH = etree.XPath(f"//*[{class_xpath('gs_r', 'gs_or', 'gs_scl')}]")  # .gs_r.gs_or.gs_scl
+TITLE_LINK_XPATH = etree.XPath(f".//*[{class_xpath('gs_rt')}]//a")  # .gs_rt a
+AUTHORS_VENUE_XPATH = etree.XPath(f".//*[{class_xpath('gs_a')}]")  # .gs_a
+ABSTRACT_XPATH = etree.XPath(f".//*[{class_xpath('gs_rs')}]")  # .gs_rs
+FULL_TEXT_LINKS_XPATH = etree.XPath(f".//*[{class_xpath('gs_or_ggsm')}]//a")  # .gs_or_ggsm a
+
+# Append-only metadata log, opened in main(), and the papers it already holds
+metadata_log = None
+recorded_papers = set()
+# Caps concurrent PDF downloads; created in collect_papers() inside the event loop
+download_limit = None
 
 def clean_filename(filename):
     """Clean a string to make it suitable for a filename."""
@@ -52,7 +75,34 @@ def clean_filename(filename):
         filename = filename.replace(char, '_')
     return filename.strip()
 
-def search_scholar(query, start=0, num_results=10):
+def snippet_digest(paper):
+    """Hash a paper's title, authors and abstract into a short hex digest."""
+    snippet = f"{paper['title']}\n{paper['authors']}\n{paper['abstract']}"
+    return hashlib.blake2b(snippet.encode("utf-8"), digest_size=8).hexdigest()
+
+def paper_key(paper):
+    """
+    Identify a paper by its link
+    
+    Papers without a link (often all titled "Unknown Title") are told
+    apart by a digest of their search snippet instead.
+    """
+    return paper["link"] or f"{paper['title']}#{snippet_digest(paper)}"
+
+def load_metadata():
+    """Load every record in the metadata log."""
+    if not os.path.exists(METADATA_LOG):
+        return []
+    
+    with open(METADATA_LOG, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def record_metadata(record):
+    """Append a paper's metadata record to the log."""
+    metadata_log.write(json.dumps(record) + "\n")
+    recorded_papers.add(record["key"])
+
+async def search_scholar(session, query, start=0, num_results=10):
     """Search Google Scholar for papers."""
     base_url = "https://scholar.google.com/scholar"
     params = {
@@ -70,10 +120,9 @@ def search_scholar(query, start=0, num_results=10):
     url = f"{base_url}?{'&'.join(url_parts)}"
     
     try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        
-        return response.text
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return await response.text()
     except Exception as e:
         print(f"Error searching Google Scholar: {e}")
         return None
@@ -84,33 +133,35 @@ def extract_paper_info(html):
         return []
     
     papers = []
-    soup = BeautifulSoup(html, "html.parser")
+    # Parse with lxml's C parser instead of BeautifulSoup's pure-Python one
+    tree = lxml_html.fromstring(html)
     
     # Find all paper entries
-    for result in soup.select(".gs_r.gs_or.gs_scl"):
+    for result in RESULT_XPATH(tree):
         try:
             # Extract title and link
-            title_elem = result.select_one(".gs_rt a")
-            title = title_elem.text if title_elem else "Unknown Title"
-            link = title_elem["href"] if title_elem and "href" in title_elem.attrs else None
+            title_elems = TITLE_LINK_XPATH(result)
+            title_elem = title_elems[0] if title_elems else None
+            title = title_elem.text_content() if title_elem is not None else "Unknown Title"
+            link = title_elem.get("href") if title_elem is not None else None
             
             # Extract authors, venue, year
-            authors_venue_elem = result.select_one(".gs_a")
-            authors_venue_text = authors_venue_elem.text if authors_venue_elem else ""
+            authors_venue_elems = AUTHORS_VENUE_XPATH(result)
+            authors_venue_text = authors_venue_elems[0].text_content() if authors_venue_elems else ""
             
             # Try to extract year using regex
             year_match = re.search(r'\b(19|20)\d{2}\b', authors_venue_text)
             year = year_match.group(0) if year_match else "Unknown Year"
             
             # Extract abstract
-            abstract_elem = result.select_one(".gs_rs")
-            abstract = abstract_elem.text if abstract_elem else ""
+            abstract_elems = ABSTRACT_XPATH(result)
+            abstract = abstract_elems[0].text_content() if abstract_elems else ""
             
             # Check if PDF is available
             pdf_link = None
-            for a_tag in result.select(".gs_or_ggsm a"):
-                if "[PDF]" in a_tag.text:
-                    pdf_link = a_tag["href"]
+            for a_tag in FULL_TEXT_LINKS_XPATH(result):
+                if "[PDF]" in a_tag.text_content():
+                    pdf_link = a_tag.get("href")
                     break
             
             papers.append({
@@ -127,116 +178,171 @@ def extract_paper_info(html):
     
     return papers
 
-def download_pdf(url, filename):
-    """Download a PDF file."""
-    try:
-        response = requests.get(url, headers=HEADERS, stream=True)
-        response.raise_for_status()
+async def download_pdf(session, url, filename):
+    """Download a PDF file, waiting for a free download slot first."""
+    async with download_limit:
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                
+                # Check if it's actually a PDF
+                content_type = response.headers.get("Content-Type", "").lower()
+                if "pdf" not in content_type and not url.lower().endswith(".pdf"):
+                    print(f"Warning: URL does not appear to be a PDF: {url}")
+                    return False
+                
+                # Save the PDF, writing in a worker thread so the other
+                # downloads keep running on the event loop
+                with open(filename, "wb") as f:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+            
+            return True
         
-        # Check if it's actually a PDF
-        content_type = response.headers.get("Content-Type", "").lower()
-        if "pdf" not in content_type and not url.lower().endswith(".pdf"):
-            print(f"Warning: URL does not appear to be a PDF: {url}")
+        except Exception as e:
+            print(f"Error downloading PDF: {e}")
             return False
-        
-        # Save the PDF
-        with open(filename, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        return True
+
+async def download_paper_pdf(session, paper_metadata, pdf_filename):
+    """Download a paper's PDF, then record its metadata with the result."""
+    pdf_path = os.path.join(OUTPUT_DIR, pdf_filename)
     
-    except Exception as e:
-        print(f"Error downloading PDF: {e}")
-        return False
+    print(f"Downloading PDF: {paper_metadata['title']}")
+    success = await download_pdf(session, paper_metadata["pdf_link"], pdf_path)
+    
+    if success:
+        paper_metadata["pdf_downloaded"] = True
+        paper_metadata["pdf_filename"] = pdf_filename
+    
+    record_metadata(paper_metadata)
 
-def main():
-    """Main function to search for and collect OpenSim papers."""
-    print("Starting OpenSim paper collection...")
+async def collect_papers():
+    """
+    Search for papers page by page, downloading PDFs in the background
+    
+    Returns:
+        int: Number of papers collected
+    """
+    global download_limit
+    download_limit = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
     
     papers_collected = 0
+    downloads = []
     
-    for query in SEARCH_QUERIES:
-        print(f"\nSearching for: {query}")
-        
-        # Search multiple pages
-        for page in range(0, 5):  # 5 pages, 10 results each = 50 max per query
-            if papers_collected >= MAX_PAPERS:
-                break
-            
-            start = page * 10
-            html = search_scholar(query, start=start)
+    async with aiohttp.ClientSession(headers=HEADERS) as session:
+        for query in SEARCH_QUERIES:
+            print(f"\nSearching for: {query}")
             
-            if not html:
-                continue
-            
-            papers = extract_paper_info(html)
-            print(f"Found {len(papers)} papers on page {page+1}")
-            
-            for paper in papers:
+            # Search multiple pages
+            for page in range(0, 5):  # 5 pages, 10 results each = 50 max per query
                 if papers_collected >= MAX_PAPERS:
                     break
                 
-                # Create a clean filename from the title
-                base_filename = clean_filename(paper["title"])[:100]  # Limit length
-                
-                # Save paper metadata and abstract
-                metadata_filename = f"{base_filename}.txt"
-                metadata_path = os.path.join(OUTPUT_DIR, metadata_filename)
+                start = page * 10
+                html = await search_scholar(session, query, start=start)
                 
-                with open(metadata_path, "w", encoding="utf-8") as f:
-                    f.write(f"Title: {paper['title']}\n")
-                    f.write(f"Authors: {paper['authors']}\n")
-                    f.write(f"Year: {paper['year']}\n")
-                    f.write(f"Link: {paper['link']}\n")
-                    f.write(f"PDF Link: {paper['pdf_link']}\n")
-                    f.write(f"Query: {query}\n")
-                    f.write(f"Date Collected: {time.strftime('%Y-%m-%d')}\n")
-                    f.write("\nAbstract:\n")
-                    f.write(paper["abstract"])
+                if not html:
+                    continue
                 
-                # Add to metadata
-                paper_metadata = {
-                    "title": paper["title"],
-                    "authors": paper["authors"],
-                    "year": paper["year"],
-                    "link": paper["link"],
-                    "pdf_link": paper["pdf_link"],
-                    "query": query,
-                    "filename": metadata_filename,
-                    "pdf_downloaded": False,
-                    "date_collected": time.strftime("%Y-%m-%d")
-                }
+                papers = extract_paper_info(html)
+                print(f"Found {len(papers)} papers on page {page+1}")
                 
-                # Try to download PDF if available
-                if paper["pdf_link"]:
-                    pdf_filename = f"{base_filename}.pdf"
-                    pdf_path = os.path.join(OUTPUT_DIR, pdf_filename)
+                for paper in papers:
+                    if papers_collected >= MAX_PAPERS:
+                        break
+                    
+                    # Skip papers collected by an earlier run or query
+                    key = paper_key(paper)
+                    if key in recorded_papers:
+                        continue
+                    
+                    # Create a clean filename from the title, made unique by
+                    # the snippet digest for papers without a link
+                    base_filename = clean_filename(paper["title"])[:100]  # Limit length
+                    if not paper["link"]:
+                        base_filename += f"_{snippet_digest(paper)}"
                     
-                    print(f"Downloading PDF: {paper['title']}")
-                    success = download_pdf(paper["pdf_link"], pdf_path)
+                    # Save paper metadata and abstract
+                    metadata_filename = f"{base_filename}.txt"
+                    metadata_path = os.path.join(OUTPUT_DIR, metadata_filename)
                     
-                    if success:
-                        paper_metadata["pdf_downloaded"] = True
-                        paper_metadata["pdf_filename"] = pdf_filename
+                    with open(metadata_path, "w", encoding="utf-8") as f:
+                        f.write(
+                            f"Title: {paper['title']}\n"
+                            f"Authors: {paper['authors']}\n"
+                            f"Year: {paper['year']}\n"
+                            f"Link: {paper['link']}\n"
+                            f"PDF Link: {paper['pdf_link']}\n"
+                            f"Query: {query}\n"
+                            f"Date Collected: {TODAY}\n"
+                            "\nAbstract:\n"
+                            f"{paper['abstract']}"
+                        )
+                    
+                    # Add to metadata
+                    paper_metadata = {
+                        "key": key,
+                        "title": paper["title"],
+                        "authors": paper["authors"],
+                        "year": paper["year"],
+                        "link": paper["link"],
+                        "pdf_link": paper["pdf_link"],
+                        "query": query,
+                        "filename": metadata_filename,
+                        "pdf_downloaded": False,
+                        "date_collected": TODAY
+                    }
+                    
+                    # Download the PDF if available while the search continues;
+                    # the paper is recorded once its download finishes
+                    if paper["pdf_link"]:
+                        pdf_filename = f"{base_filename}.pdf"
+                        downloads.append(asyncio.create_task(
+                            download_paper_pdf(session, paper_metadata, pdf_filename)
+                        ))
+                    else:
+                        record_metadata(paper_metadata)
+                    
+                    recorded_papers.add(key)
+                    papers_collected += 1
                 
-                metadata.append(paper_metadata)
-                papers_collected += 1
-            
-            # Delay between pages to avoid being blocked
-            time.sleep(DELAY)
+                # Delay between pages to avoid being blocked
+                await asyncio.sleep(DELAY)
+        
+        # Wait for the remaining PDF downloads
+        await asyncio.gather(*downloads, return_exceptions=True)
+    
+    return papers_collected
+
+def main():
+    """Main function to search for and collect OpenSim papers."""
+    global metadata_log
+    print("Starting OpenSim paper collection...")
+    
+    # Append new papers to the log from earlier runs as they are collected,
+    # so a crash keeps everything recorded so far
+    # Records from before keys were stored are identified by link or title
+    recorded_papers.update(
+        record.get("key") or record["link"] or record["title"] for record in load_metadata()
+    )
+    with open(METADATA_LOG, "a", encoding="utf-8", buffering=METADATA_BUFFER_SIZE) as metadata_log:
+        papers_collected = asyncio.run(collect_papers())
     
-    # Save metadata
+    # Convert the full log to JSON and CSV once
+    metadata = load_metadata()
     metadata_file = os.path.join(OUTPUT_DIR, "metadata.json")
     with open(metadata_file, "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2)
     
-    # Create a DataFrame for easier analysis
-    df = pd.DataFrame(metadata)
+    # Write a CSV for easier analysis, with every key any record has as a column
+    fieldnames = list(dict.fromkeys(key for record in metadata for key in record))
     csv_file = os.path.join(OUTPUT_DIR, "metadata.csv")
-    df.to_csv(csv_file, index=False)
+    with open(csv_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(metadata)
     
-    print(f"\nPaper collection completed. Collected {papers_collected} papers.")
+    print(f"\nPaper collection completed. Collected {papers_collected} new papers, {len(metadata)} in total.")
     print(f"Results saved to {OUTPUT_DIR}")
 
 if __name__ == "__main__":
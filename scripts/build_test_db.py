@@ -8,6 +8,7 @@ It uses a subset of the processed chunks to create a FAISS index quickly.
 
 import os
 import json
+import itertools
 import numpy as np
 import faiss
 import spacy
@@ -17,116 +18,138 @@ PROCESSED_DIR = "../processed_data"
 VECTOR_DB_DIR = "../vector_db"
 MAX_CHUNKS = 1000  # Limit number of chunks for faster processing
 EMBEDDING_SIZE = 300  # Fixed embedding size
+SPACY_BATCH_SIZE = 128  # Chunks tokenized per spaCy batch
+SPACY_N_PROCESS = 1  # Worker processes for nlp.pipe; raise for much larger chunk sets
+SPACY_DISABLED_PIPES = ["tok2vec", "tagger", "parser", "ner", "lemmatizer", "attribute_ruler"]  # Unused pipeline components
+HNSW_M = 32  # Graph neighbors per node for the HNSW index
+HNSW_EF_CONSTRUCTION = 200  # Build-time search depth for the HNSW index; higher builds a better graph
 
 # Create vector_db directory if it doesn't exist
 os.makedirs(VECTOR_DB_DIR, exist_ok=True)
 
 # Load spaCy model
 print("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
+nlp = spacy.load("en_core_web_sm", disable=SPACY_DISABLED_PIPES)
 
 def get_embedding(text):
     """Get embedding vector for a text using spaCy."""
-    # Process with spaCy
-    doc = nlp(text)
-    
-    # Create a fixed-size vector
-    vec = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
-    
+    # Only the tokenizer is needed: lexical attributes and static word
+    # vectors do not depend on the tagger, parser or NER
+    return embed_doc(nlp.make_doc(text))
+
+def embed_doc(doc):
+    """Get embedding vector for a tokenized spaCy doc."""
     # Use spaCy's built-in word vectors if available
     if doc.vector.any() and len(doc.vector) == EMBEDDING_SIZE:
         return doc.vector
     
-    # Create a simple TF-IDF like representation
-    # Count word frequencies
-    word_freq = {}
-    for token in doc:
-        if token.is_alpha and not token.is_stop:
-            word = token.text.lower()
-            word_freq[word] = word_freq.get(word, 0) + 1
-    
-    # Use hash of words to determine vector positions
-    for word, freq in word_freq.items():
-        # Simple hash function to get a position
-        pos = hash(word) % EMBEDDING_SIZE
-        vec[pos] += freq
-    
-    # Normalize
-    norm = np.linalg.norm(vec)
-    if norm > 0:
-        vec = vec / norm
-    
-    return vec
+    # Create a simple TF-IDF like representation by hashing each
+    # content word into a vector position and counting. token.lower is
+    # the 64-bit hash spaCy's tokenizer already computed for the lowercase
+    # form; it is stable across processes, so the RAG system maps query
+    # words to the same positions.
+    hashes = np.fromiter((token.lower for token in doc if token.is_alpha and not token.is_stop), dtype=np.uint64)
+    positions = (hashes % EMBEDDING_SIZE).astype(np.int64)
+    
+    return np.bincount(positions, minlength=EMBEDDING_SIZE).astype(np.float32)
 
 def build_vector_database():
     """Build a FAISS vector database from the chunks."""
     print("Building vector database (simplified version)...")
     
     # Load chunks
-    chunks_file = os.path.join(PROCESSED_DIR, 'chunks.json')
+    chunks_file = os.path.join(PROCESSED_DIR, 'chunks.jsonl')
     if not os.path.exists(chunks_file):
         print(f"Error: Chunks file not found at {chunks_file}")
         return False
     
+    # Limit number of chunks for faster processing; only the lines that
+    # are used get read and parsed
     with open(chunks_file, 'r', encoding='utf-8') as f:
-        all_chunks = json.load(f)
-    
-    print(f"Loaded {len(all_chunks)} chunks")
+        lines = (line for line in f if line.strip())
+        chunks = [json.loads(line) for line in itertools.islice(lines, MAX_CHUNKS)]
     
-    # Limit number of chunks for faster processing
-    chunks = all_chunks[:MAX_CHUNKS]
     print(f"Using {len(chunks)} chunks for simplified vector database")
     
-    # Generate embeddings for each chunk
-    embeddings = []
-    chunk_ids = []
+    # Generate embeddings for each chunk straight into a preallocated array
+    embeddings_array = np.empty((len(chunks), EMBEDDING_SIZE), dtype=np.float32)
+    chunk_ids = list(range(len(chunks)))
     
     print("Generating embeddings...")
-    for i, chunk in enumerate(chunks):
+    texts = [chunk['chunk_text'] for chunk in chunks]
+    docs = nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS)
+    for i, doc in enumerate(docs):
         if i % 100 == 0:
             print(f"Processing chunk {i}/{len(chunks)}")
         
-        text = chunk['chunk_text']
-        embedding = get_embedding(text)
+        embedding = embed_doc(doc)
         
         # Ensure embedding is the correct shape
         if embedding.shape != (EMBEDDING_SIZE,):
             print(f"Warning: Embedding {i} has shape {embedding.shape}, fixing...")
             embedding = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
         
-        embeddings.append(embedding)
-        chunk_ids.append(i)
+        embeddings_array[i] = embedding
+    
+    # Normalize so inner product equals cosine similarity
+    faiss.normalize_L2(embeddings_array)
     
-    # Convert to numpy array
-    embeddings_array = np.array(embeddings, dtype=np.float32)
+    # Let FAISS spread distance computations over every core
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
     
     # Create FAISS index
     dimension = embeddings_array.shape[1]
-    index = faiss.IndexFlatL2(dimension)
+    index = faiss.IndexFlatIP(dimension)
     index.add(embeddings_array)
     
     # Save the index
     faiss_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_index.bin')
     faiss.write_index(index, faiss_index_file)
     
-    # Save the mapping from FAISS IDs to chunk IDs
+    # Build an HNSW graph index alongside the flat one for sub-linear search
+    hnsw_index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    hnsw_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    hnsw_index.add(embeddings_array)
+    
+    hnsw_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_hnsw.bin')
+    faiss.write_index(hnsw_index, hnsw_index_file)
+    
+    # Save the mapping from FAISS IDs to chunk IDs, as JSON and as a
+    # binary array the RAG system can memory-map
     mapping_file = os.path.join(VECTOR_DB_DIR, 'id_mapping.json')
     with open(mapping_file, 'w') as f:
         json.dump(chunk_ids, f)
-    
-    # Also save a mapping from chunk IDs to original chunks
-    chunk_mapping_file = os.path.join(VECTOR_DB_DIR, 'chunk_mapping.json')
-    chunk_mapping = {}
-    for i, chunk_id in enumerate(chunk_ids):
-        chunk_mapping[str(i)] = chunks[chunk_id]
-    
-    with open(chunk_mapping_file, 'w', encoding='utf-8') as f:
-        json.dump(chunk_mapping, f)
-    
-    print(f"Vector database built with {len(embeddings)} vectors of dimension {dimension}")
+    np.save(os.path.join(VECTOR_DB_DIR, 'id_mapping.npy'), np.asarray(chunk_ids, dtype=np.int32))
+    
+    # Save chunk texts as one UTF-8 blob plus byte offsets, so the RAG
+    # system can memory-map them and only decode the chunks a query retrieves
+    encoded_texts = [chunk['chunk_text'].encode('utf-8') for chunk in chunks]
+    offsets = np.zeros(len(encoded_texts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded_texts])
+    
+    texts_file = os.path.join(VECTOR_DB_DIR, 'chunks.bin')
+    with open(texts_file, 'wb') as f:
+        f.write(b''.join(encoded_texts))
+    np.save(os.path.join(VECTOR_DB_DIR, 'offsets.npy'), offsets)
+    
+    # Save the remaining chunk metadata without the text
+    chunk_metadata = [
+        {
+            'title': chunk.get('title', chunk.get('Title', 'Unknown')),
+            'url': chunk.get('url', chunk.get('URL', '')),
+            'source_file': chunk.get('source_file', 'Unknown')
+        }
+        for chunk in chunks
+    ]
+    metadata_file = os.path.join(VECTOR_DB_DIR, 'chunk_metadata.json')
+    with open(metadata_file, 'w') as f:
+        json.dump(chunk_metadata, f)
+    
+    print(f"Vector database built with {len(embeddings_array)} vectors of dimension {dimension}")
     print(f"FAISS index saved to {faiss_index_file}")
+    print(f"FAISS HNSW index saved to {hnsw_index_file}")
     print(f"ID mapping saved to {mapping_file}")
-    print(f"Chunk mapping saved to {chunk_mapping_file}")
+    print(f"Chunk store saved to {texts_file} with metadata in {metadata_file}")
     
     return True
 
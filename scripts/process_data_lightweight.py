@@ -7,9 +7,12 @@ This script enhances the embedding quality by using Sentence Transformers.
 
 import os
 import re
+import hashlib
+import bisect
+import csv
+from array import array
 import json
-import glob
-import pandas as pd
+import multiprocessing
 import numpy as np
 from tqdm import tqdm
 import faiss
@@ -19,15 +22,42 @@ DATA_DIR = "../data"
 PROCESSED_DIR = "../processed_data"
 VECTOR_DB_DIR = "../vector_db"
 MODELS_DIR = "../models"  # Directory to store downloaded models
+EMBEDDING_CACHE_DIR = os.path.join(PROCESSED_DIR, "embedding_cache")  # Embeddings from earlier runs, keyed by text hash
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'  # Small (about 40-80MB) but effective Sentence Transformers model
 CHUNK_SIZE = 1000  # Characters per chunk
 CHUNK_OVERLAP = 200  # Character overlap between chunks
 MAX_CHUNKS_PER_FILE = 50  # Maximum number of chunks to extract from a single file
 EMBEDDING_DIMENSION = 384  # Will be set based on the model
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))  # Chunks encoded per model batch
+WHITESPACE_RE = re.compile(r'\s+')  # Runs of whitespace, including newlines
+SENTENCE_END_RE = re.compile(r'\. ')  # A period followed by a space ends a sentence
+DISALLOWED_CHARS_RE = re.compile(r'[^\w\s.,;:!?()-]')  # Anything but letters, digits, spaces and basic punctuation
+WRITE_CSV = os.environ.get("WRITE_CSV") == "1"  # Also write chunks.csv for inspection; off by default
+ENCODE_PROCESSES = max(1, (os.cpu_count() or 1) // 2)  # CPU encoder processes for large batches
+MULTI_PROCESS_MIN_CHUNKS = 2000  # Fewest chunks worth starting CPU encoder processes for
+PROCESS_WORKERS = os.cpu_count() or 1  # Worker processes reading and chunking files
+PROCESS_CHUNKSIZE = 4  # Files handed to a worker at a time
+SIMD_ALIGNMENT = 64  # Byte alignment of the embedding matrix, one cache line / AVX-512 register
+HNSW_M = 32  # Graph neighbors per node for the HNSW index
+HNSW_EF_CONSTRUCTION = 200  # Build-time search depth for the HNSW index; higher builds a better graph
+BUILD_BATCH_SIZE = 4096  # Chunks read, encoded and added to the index at a time
+SQ_TRAIN_SIZE = 65536  # Vectors the 8-bit scalar quantizer is trained on
 
 # Create directories if they don't exist
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 os.makedirs(VECTOR_DB_DIR, exist_ok=True)
 os.makedirs(MODELS_DIR, exist_ok=True)
+os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+
+def use_half_precision(model):
+    """Run the model in FP16 on a GPU; embeddings are cast back to FP32 after encoding."""
+    import torch
+    
+    if torch.cuda.is_available():
+        print("CUDA available, running the embedding model in FP16")
+        model.half()
+    
+    return model
 
 # Setup for the embedding model
 def setup_embedding_model():
@@ -35,12 +65,11 @@ def setup_embedding_model():
     try:
         from sentence_transformers import SentenceTransformer
         
-        # Choose a small but effective model (about 40-80MB)
         # 'all-MiniLM-L6-v2' is a good balance of size and quality
-        model_name = 'all-MiniLM-L6-v2'
+        model_name = EMBEDDING_MODEL_NAME
         print(f"Loading SentenceTransformer model: {model_name}")
         
-        model = SentenceTransformer(model_name, cache_folder=MODELS_DIR)
+        model = use_half_precision(SentenceTransformer(model_name, cache_folder=MODELS_DIR))
         
         # Update the global embedding dimension based on the model
         global EMBEDDING_DIMENSION
@@ -55,29 +84,33 @@ def setup_embedding_model():
         subprocess.check_call(["pip", "install", "sentence-transformers"])
         
         from sentence_transformers import SentenceTransformer
-        model_name = 'all-MiniLM-L6-v2'
-        model = SentenceTransformer(model_name, cache_folder=MODELS_DIR)
-        
+        model_name = EMBEDDING_MODEL_NAME
+        model = use_half_precision(SentenceTransformer(model_name, cache_folder=MODELS_DIR))
         
         EMBEDDING_DIMENSION = model.get_sentence_embedding_dimension()
         print(f"Model loaded. Embedding dimension: {EMBEDDING_DIMENSION}")
         
         return model
 
-# Initialize the embedding model (only once)
-print("Setting up the embedding model...")
-embedding_model = setup_embedding_model()
+# The embedding model, loaded on first use by get_embedding_model() so the
+# worker processes that chunk files never import or copy it
+embedding_model = None
+
+def get_embedding_model():
+    """Get the embedding model, loading it on first use."""
+    global embedding_model
+    if embedding_model is None:
+        print("Setting up the embedding model...")
+        embedding_model = setup_embedding_model()
+    return embedding_model
 
 def clean_text(text):
     """Clean and normalize text."""
-    # Replace multiple newlines with a single one
-    text = re.sub(r'\n+', '\n', text)
-    
-    # Replace multiple spaces with a single one
-    text = re.sub(r'\s+', ' ', text)
+    # Replace runs of whitespace, newlines included, with a single space
+    text = WHITESPACE_RE.sub(' ', text)
     
-    # Remove special characters and digits (keep letters, spaces, and basic punctuation)
-    text = re.sub(r'[^\w\s.,;:!?()-]', '', text)
+    # Remove special characters (keep letters, digits, spaces, and basic punctuation)
+    text = DISALLOWED_CHARS_RE.sub('', text)
     
     return text.strip()
 
@@ -88,16 +121,20 @@ def create_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, max_chunks
     if len(text) <= chunk_size:
         chunks.append(text)
     else:
+        # Find every sentence boundary in one scan; each chunk then
+        # binary-searches for its last one instead of rescanning the text
+        sentence_ends = [match.start() for match in SENTENCE_END_RE.finditer(text)]
+        
         start = 0
         while start < len(text) and len(chunks) < max_chunks:
             end = start + chunk_size
             
             # Adjust end to not break in the middle of a sentence if possible
             if end < len(text):
-                # Try to find a sentence boundary
-                sentence_end = text.rfind('. ', start, end)
-                if sentence_end != -1:
-                    end = sentence_end + 1
+                # Last boundary whose '. ' lies entirely within [start, end)
+                i = bisect.bisect_right(sentence_ends, end - 2) - 1
+                if i >= 0 and sentence_ends[i] >= start:
+                    end = sentence_ends[i] + 1
             
             # Add the chunk
             chunks.append(text[start:end])
@@ -107,8 +144,132 @@ def create_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, max_chunks
     
     return chunks
 
+def aligned_empty(shape, alignment=SIMD_ALIGNMENT):
+    """
+    Allocate an uninitialized float32 array whose data starts on an aligned address
+    
+    Args:
+        shape (tuple): (rows, columns) of the array
+        alignment (int): Required byte alignment of the first element
+        
+    Returns:
+        np.ndarray: C-contiguous float32 array of the given shape
+    """
+    size = int(np.prod(shape))
+    itemsize = np.dtype(np.float32).itemsize
+    buffer = np.empty(size + alignment // itemsize, dtype=np.float32)
+    offset = (-buffer.ctypes.data % alignment) // itemsize
+    return buffer[offset:offset + size].reshape(shape)
+
+def text_key(text):
+    """Get the embedding cache key of a chunk text."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+def embedding_cache_files():
+    """Get the key and vector files of the embedding cache for the current model."""
+    prefix = os.path.join(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME)
+    return f"{prefix}.keys.txt", f"{prefix}.f32"
+
+def load_embedding_cache():
+    """
+    Load cached embeddings of the current model
+    
+    Returns:
+        tuple: (dict of text key to row, memory-mapped (n, dimension) vectors),
+            or ({}, None) if there is no usable cache
+    """
+    keys_file, vectors_file = embedding_cache_files()
+    if not (os.path.exists(keys_file) and os.path.exists(vectors_file)):
+        return {}, None
+    
+    with open(keys_file, 'r', encoding='utf-8') as f:
+        keys = f.read().split()
+    
+    # Ignore an empty cache or one left behind by a model with a different dimension
+    if not keys or os.path.getsize(vectors_file) != len(keys) * EMBEDDING_DIMENSION * 4:
+        return {}, None
+    
+    vectors = np.memmap(vectors_file, dtype=np.float32, mode='r', shape=(len(keys), EMBEDDING_DIMENSION))
+    return {key: row for row, key in enumerate(keys)}, vectors
+
+def open_embedding_cache_writer():
+    """
+    Open temporary files that this run's embeddings are appended to
+    
+    The cache is written as one key per line plus raw float32 rows, so
+    each batch can be appended as soon as it is encoded.
+    
+    Returns:
+        tuple: (keys file, vectors file) opened for writing
+    """
+    keys_file, vectors_file = embedding_cache_files()
+    return open(keys_file + '.tmp', 'w', encoding='utf-8'), open(vectors_file + '.tmp', 'wb')
+
+def append_embedding_cache(writer, keys, embeddings):
+    """Append a batch of embeddings to the new cache, skipping failed (zero) ones."""
+    keys_f, vectors_f = writer
+    valid = np.flatnonzero(embeddings.any(axis=1))
+    keys_f.writelines(keys[row] + '\n' for row in valid)
+    vectors_f.write(embeddings[valid].tobytes())
+
+def commit_embedding_cache(writer):
+    """Replace the embedding cache with the files written by append_embedding_cache."""
+    for f in writer:
+        f.close()
+    
+    # The temporary files are only moved into place once complete, so an
+    # interrupted run leaves the old cache intact
+    keys_file, vectors_file = embedding_cache_files()
+    os.replace(vectors_file + '.tmp', vectors_file)
+    os.replace(keys_file + '.tmp', keys_file)
+
+def start_encode_pool(model):
+    """
+    Start CPU encoder processes, or return None when they would not pay off
+    
+    On CPU, separate processes each running whole batches scale better
+    with core count than one process relying on intra-op threads.
+    """
+    if model.device.type != 'cpu' or ENCODE_PROCESSES <= 1:
+        return None
+    
+    print(f"Encoding on CPU with {ENCODE_PROCESSES} processes")
+    return model.start_multi_process_pool(target_devices=['cpu'] * ENCODE_PROCESSES)
+
+def encode_texts(model, texts, batch_size=EMBEDDING_BATCH_SIZE, pool=None):
+    """
+    Encode texts in batches, on the encoder processes of a pool if one is given
+    
+    Args:
+        model (SentenceTransformer): Embedding model
+        texts (list): Texts to encode
+        batch_size (int): Texts per model batch
+        pool (dict): Pool from start_encode_pool, or None to encode in-process
+        
+    Returns:
+        np.ndarray: (len(texts), dimension) embeddings
+    """
+    if pool is not None:
+        return model.encode_multi_process(texts, pool, batch_size=batch_size)
+    
+    return model.encode(
+        texts,
+        batch_size=batch_size,
+        show_progress_bar=False,
+        convert_to_numpy=True
+    )
+
+def is_out_of_memory(error):
+    """Check whether an encoding error was caused by running out of memory."""
+    return isinstance(error, MemoryError) or "out of memory" in str(error).lower()
+
 def get_embedding(text):
-    """Get embedding vector for a text using Sentence Transformers."""
+    """
+    Get the raw embedding vector for a text using Sentence Transformers
+    
+    The vector is not normalized; build_vector_database normalizes the
+    whole embedding matrix in one faiss.normalize_L2 call.
+    """
     # Handle empty or very short text
     if not text or len(text.strip()) < 5:
         return np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
@@ -119,17 +280,12 @@ def get_embedding(text):
             text = text[:10000]
         
         # Get embedding from Sentence Transformers
-        embedding = embedding_model.encode(text, show_progress_bar=False)
+        embedding = get_embedding_model().encode(
+            text, show_progress_bar=False, convert_to_numpy=True
+        )
         
         # Ensure correct type
-        embedding = np.array(embedding, dtype=np.float32)
-        
-        # Normalize to unit length
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
-        
-        return embedding
+        return np.asarray(embedding, dtype=np.float32)
     
     except Exception as e:
         print(f"Error generating embedding: {e}")
@@ -141,14 +297,16 @@ def process_file(file_path):
     print(f"Processing {file_path}")
     
     try:
-        # Try multiple encodings in case of issues
+        # Read the file once, then try multiple encodings in memory
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        
         content = None
         encodings = ['utf-8', 'latin-1', 'cp1252']
         
         for encoding in encodings:
             try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
+                content = raw.decode(encoding)
                 break
             except UnicodeDecodeError:
                 continue
@@ -157,6 +315,9 @@ def process_file(file_path):
             print(f"Could not read {file_path} with any encoding")
             return []
         
+        # Normalize line endings as text-mode reads did
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+        
         # Extract metadata from the first few lines if available
         lines = content.split('\n')
         metadata = {}
@@ -199,136 +360,281 @@ def process_file(file_path):
         return []
 
 def process_all_files():
-    """Process all files in the data directory."""
+    """Process all files in the data directory and stream the chunks from chunks.jsonl."""
     # Get all text files
     all_files = []
     for subdir in ['confluence_docs', 'api_docs', 'github_docs', 'papers']:
         dir_path = os.path.join(DATA_DIR, subdir)
         if os.path.exists(dir_path):
-            files = glob.glob(os.path.join(dir_path, '*.txt'))
-            all_files.extend(files)
+            # scandir's entries already know their type, so no extra stat per file
+            with os.scandir(dir_path) as entries:
+                all_files.extend(
+                    entry.path for entry in entries
+                    if entry.name.endswith('.txt') and entry.is_file()
+                )
     
     print(f"Found {len(all_files)} files to process")
     
-    # Process files and collect chunks
-    all_chunks = []
+    # Process files in parallel; imap keeps results in file order, so chunk
+    # IDs stay stable between runs. Each file's chunks are written to disk
+    # as one JSON line per chunk as soon as they arrive, so no chunk list
+    # is kept in memory.
+    chunks_file = os.path.join(PROCESSED_DIR, 'chunks.jsonl')
+    num_chunks = 0
+    fieldnames = {}
+    with multiprocessing.Pool(PROCESS_WORKERS) as pool, \
+            open(chunks_file, 'w', encoding='utf-8') as f:
+        for chunks in tqdm(pool.imap(process_file, all_files, chunksize=PROCESS_CHUNKSIZE), total=len(all_files)):
+            f.writelines(json.dumps(chunk) + '\n' for chunk in chunks)
+            num_chunks += len(chunks)
+            # Metadata keys vary per file, so the CSV columns are collected here
+            for chunk in chunks:
+                fieldnames.update(dict.fromkeys(chunk))
+    
+    print(f"Created {num_chunks} chunks from {len(all_files)} files")
+    
+    # Nothing in the pipeline reads the CSV, so it is only written on request;
+    # its rows are streamed back from chunks.jsonl
+    if WRITE_CSV:
+        csv_file = os.path.join(PROCESSED_DIR, 'chunks.csv')
+        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(fieldnames))
+            writer.writeheader()
+            writer.writerows(iter_chunks(chunks_file))
+        print(f"Chunk CSV saved to {csv_file}")
+    
+    return iter_chunks(chunks_file)
+
+def iter_chunks(chunks_file):
+    """Yield chunks one at a time from a chunks.jsonl file."""
+    with open(chunks_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def embed_batch(model, texts, embeddings, batch_size, pool):
+    """
+    Encode a batch of texts into the rows of embeddings
+    
+    Tokenization and the model forward pass run over whole batches instead
+    of single strings. encode() sorts the texts by length before batching
+    and restores the original order afterwards, so each batch pads to
+    similar lengths and rows still line up with texts.
+    
+    Returns:
+        int: The batch size to use from now on
+    """
+    while True:
+        try:
+            embeddings[:] = encode_texts(model, texts, batch_size, pool)
+            return batch_size
+        except Exception as e:
+            # Out of memory: retry the whole batch with half the batch size
+            if is_out_of_memory(e) and batch_size > 1:
+                batch_size //= 2
+                print(f"Out of memory while encoding, retrying with batch size {batch_size}")
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                continue
+            
+            # Fall back to one chunk at a time, where failures become zero vectors
+            print(f"Error generating batched embeddings: {e}")
+            for row, text in enumerate(texts):
+                embeddings[row] = get_embedding(text)
+            return batch_size
+
+def add_in_slices(source, target):
+    """Add every vector of a flat index to another index, BUILD_BATCH_SIZE rows at a time."""
+    for start in range(0, source.ntotal, BUILD_BATCH_SIZE):
+        target.add(source.reconstruct_n(start, min(BUILD_BATCH_SIZE, source.ntotal - start)))
+
+def build_vector_database(chunks):
+    """
+    Build a FAISS vector database from the chunks
     
-    # Process each file
-    for file_path in tqdm(all_files):
-        chunks = process_file(file_path)
-        all_chunks.extend(chunks)
+    Chunks are read, encoded and added to the index BUILD_BATCH_SIZE at a
+    time, so apart from the index itself memory does not grow with the
+    corpus.
     
-    print(f"Created {len(all_chunks)} chunks from {len(all_files)} files")
+    Args:
+        chunks (iterable): Chunk dicts; read once, so a generator works
+        
+    Returns:
+        faiss.Index: The exhaustive inner-product index
+    """
+    print("Building vector database...")
     
-    # Save chunks to file
-    chunks_file = os.path.join(PROCESSED_DIR, 'chunks.json')
-    with open(chunks_file, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, indent=2)
+    # Load the model here, in the main process, after any file-processing
+    # workers have finished; this also fixes EMBEDDING_DIMENSION
+    model = get_embedding_model()
+    dimension = EMBEDDING_DIMENSION
     
-    # Create DataFrame for easier processing
-    df = pd.DataFrame(all_chunks)
-    csv_file = os.path.join(PROCESSED_DIR, 'chunks.csv')
-    df.to_csv(csv_file, index=False)
+    # The exhaustive index doubles as the store of every embedding, from
+    # which the other indexes are built afterwards
+    index = faiss.IndexFlatIP(dimension)
     
-    return all_chunks
-
-def build_vector_database(chunks):
-    """Build a FAISS vector database from the chunks."""
-    print("Building vector database...")
+    # Reuse the embeddings of chunk texts an earlier run already encoded,
+    # so only new or changed chunks go through the model
+    cache_rows, cached_vectors = load_embedding_cache()
+    cache_writer = open_embedding_cache_writer()
+    num_reused = 0
     
-    # Generate embeddings for each chunk
-    embeddings = []
-    chunk_ids = []
-    successful_chunks = []
+    chunk_ids = array('i')
     failed_chunks = []
-    
-    # Process each chunk
-    for i, chunk in enumerate(tqdm(chunks, desc="Generating embeddings")):
-        try:
-            text = chunk['chunk_text']
-            
-            # Skip empty chunks
-            if not text or len(text.strip()) < 10:
-                failed_chunks.append({
-                    'chunk_id': i,
-                    'reason': 'empty_text',
-                    'chunk': chunk
-                })
-                continue
-            
-            # Get embedding
-            embedding = get_embedding(text)
-            
-            # Verify embedding
-            if embedding is None or embedding.shape[0] != EMBEDDING_DIMENSION:
-                print(f"Warning: Chunk {i} has invalid embedding shape: {embedding.shape if embedding is not None else 'None'}")
-                # Create a zero vector
-                embedding = np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
-            
-            # Add to results
-            embeddings.append(embedding)
-            chunk_ids.append(i)
-            successful_chunks.append(chunk)
+    offsets = array('q', [0])
+    batch_texts = []
+    batch_size = EMBEDDING_BATCH_SIZE
+    pool = None
+    
+    def flush_batch():
+        """Encode the buffered texts and add them to the index."""
+        nonlocal num_reused, batch_size, pool
+        keys = [text_key(text) for text in batch_texts]
+        
+        # Aligned so FAISS's SIMD kernels get aligned loads
+        embeddings = aligned_empty((len(batch_texts), dimension))
+        hit_rows = [row for row, key in enumerate(keys) if key in cache_rows]
+        miss_rows = [row for row, key in enumerate(keys) if key not in cache_rows]
+        if hit_rows:
+            embeddings[hit_rows] = cached_vectors[[cache_rows[keys[row]] for row in hit_rows]]
+        num_reused += len(hit_rows)
+        
+        if miss_rows:
+            if pool is None and len(miss_rows) >= MULTI_PROCESS_MIN_CHUNKS:
+                pool = start_encode_pool(model)
+            miss_embeddings = aligned_empty((len(miss_rows), dimension))
+            batch_size = embed_batch(
+                model, [batch_texts[row] for row in miss_rows], miss_embeddings, batch_size, pool
+            )
+            embeddings[miss_rows] = miss_embeddings
+        
+        # Normalize every row in place in one call, so inner product equals
+        # cosine similarity; zero vectors are left as they are
+        faiss.normalize_L2(embeddings)
+        append_embedding_cache(cache_writer, keys, embeddings)
+        index.add(embeddings)
+        batch_texts.clear()
+    
+    # Every chunk's text and metadata go straight to the chunk store in
+    # input order, so the store is indexed by chunk ID and no chunk dict is
+    # kept after it is read
+    texts_file = os.path.join(VECTOR_DB_DIR, 'chunks.bin')
+    metadata_file = os.path.join(VECTOR_DB_DIR, 'chunk_metadata.json')
+    try:
+        with open(texts_file, 'wb') as texts_f, open(metadata_file, 'w') as metadata_f:
+            metadata_f.write('[')
+            for i, chunk in enumerate(tqdm(chunks, desc="Embedding chunks")):
+                text = chunk.get('chunk_text')
+                
+                # Save the chunk text as part of one UTF-8 blob plus byte offsets,
+                # so the app can memory-map it and only decode retrieved chunks
+                encoded_text = (text or '').encode('utf-8')
+                texts_f.write(encoded_text)
+                offsets.append(offsets[-1] + len(encoded_text))
+                
+                # Save the remaining chunk metadata without the text
+                metadata_f.write((',' if i else '') + json.dumps({
+                    'title': chunk.get('title', chunk.get('Title', 'Unknown')),
+                    'url': chunk.get('url', chunk.get('URL', '')),
+                    'source_file': chunk.get('source_file', 'Unknown')
+                }))
+                
+                # Skip empty chunks
+                if not text or len(text.strip()) < 10:
+                    failed_chunks.append({
+                        'chunk_id': i,
+                        'reason': 'empty_text'
+                    })
+                    continue
+                
+                # Limit text length to avoid memory issues with very long texts
+                batch_texts.append(text[:10000])
+                chunk_ids.append(i)
+                if len(batch_texts) >= BUILD_BATCH_SIZE:
+                    flush_batch()
             
-        except Exception as e:
-            failed_chunks.append({
-                'chunk_id': i,
-                'reason': str(e),
-                'chunk': chunk
-            })
-            print(f"Error processing chunk {i}: {e}")
+            if batch_texts:
+                flush_batch()
+            metadata_f.write(']')
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+    np.save(os.path.join(VECTOR_DB_DIR, 'offsets.npy'), np.frombuffer(offsets, dtype=np.int64))
     
     # Log results
-    print(f"Successfully processed {len(embeddings)} chunks")
+    print(f"Embedded {index.ntotal} chunks, reusing {num_reused} cached embeddings")
     print(f"Failed to process {len(failed_chunks)} chunks")
     
-    if not embeddings:
+    if index.ntotal == 0:
         raise ValueError("No valid embeddings found. Check your embedding function.")
     
-    # Convert to numpy array
-    embeddings_array = np.array(embeddings, dtype=np.float32)
+    cached_vectors = None  # Release the mapping before the cache is replaced
+    commit_embedding_cache(cache_writer)
+    
+    # Build each remaining index from the exhaustive one, write it and free
+    # it before building the next, so at most one extra copy of the
+    # embeddings is held. The app memory-maps the written files instead of
+    # loading them.
+    
+    # Build an HNSW graph index alongside the flat one for sub-linear search
+    hnsw_index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    hnsw_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    add_in_slices(index, hnsw_index)
+    
+    hnsw_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_hnsw.bin')
+    faiss.write_index(hnsw_index, hnsw_index_file)
+    del hnsw_index
+    
+    # Build an 8-bit scalar quantized inner-product index (4x smaller than
+    # fp32); its per-dimension ranges are trained on a sample of the vectors
+    sq_index = faiss.IndexScalarQuantizer(
+        dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    sq_index.train(index.reconstruct_n(0, min(SQ_TRAIN_SIZE, index.ntotal)))
+    add_in_slices(index, sq_index)
     
-    # Create FAISS index
-    dimension = embeddings_array.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings_array)
+    sq_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_sq8.bin')
+    faiss.write_index(sq_index, sq_index_file)
+    del sq_index
     
-    # Save the index
+    # Save the exhaustive index
     faiss_index_file = os.path.join(VECTOR_DB_DIR, 'faiss_index.bin')
     faiss.write_index(index, faiss_index_file)
     
     # Save the mapping from FAISS IDs to chunk IDs
     mapping_file = os.path.join(VECTOR_DB_DIR, 'id_mapping.json')
     with open(mapping_file, 'w') as f:
-        json.dump(chunk_ids, f)
+        json.dump(chunk_ids.tolist(), f)
+    np.save(os.path.join(VECTOR_DB_DIR, 'id_mapping.npy'), np.frombuffer(chunk_ids, dtype=np.int32))
     
-    # Save successful chunks
+    # The chunk store replaces the full successful_chunks.json dump; remove a
+    # stale one so it cannot be read against the new ID mapping
     successful_chunks_file = os.path.join(VECTOR_DB_DIR, 'successful_chunks.json')
-    with open(successful_chunks_file, 'w') as f:
-        json.dump(successful_chunks, f)
+    if os.path.exists(successful_chunks_file):
+        os.remove(successful_chunks_file)
     
     # Save failed chunks
     failed_chunks_file = os.path.join(VECTOR_DB_DIR, 'failed_chunks.json')
     with open(failed_chunks_file, 'w') as f:
         json.dump(failed_chunks, f)
     
-    print(f"Vector database built with {len(embeddings)} vectors of dimension {dimension}")
+    print(f"Vector database built with {index.ntotal} vectors of dimension {dimension}")
     return index
 
 def main():
     """Main function to process data and build vector database."""
-    global EMBEDDING_DIMENSION
     print("Starting OpenSim RAG data processing with improved embeddings...")
     
     # You mentioned you already have the data scraped and stored properly
     # So let's load existing chunks if available, or process files if needed
-    chunks_file = os.path.join(PROCESSED_DIR, 'chunks.json')
+    chunks_file = os.path.join(PROCESSED_DIR, 'chunks.jsonl')
     
     if os.path.exists(chunks_file):
-        print(f"Loading existing chunks from {chunks_file}")
-        with open(chunks_file, 'r', encoding='utf-8') as f:
-            chunks = json.load(f)
-        print(f"Loaded {len(chunks)} existing chunks")
+        # Stream existing chunks straight into the builder instead of
+        # holding a second parsed copy of the whole corpus
+        print(f"Streaming existing chunks from {chunks_file}")
+        chunks = iter_chunks(chunks_file)
     else:
         # Process all files and get chunks
         chunks = process_all_files()
@@ -7,10 +7,13 @@ This script tests the OpenSim RAG system by sending sample queries and evaluatin
 
 import requests
 import json
-import time
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration
 API_URL = "http://localhost:5000/api/query"
+MAX_WORKERS = 4  # Queries in flight at once
+WORD_RE = re.compile(r'\w+')  # Words compared by the relevance check
 TEST_QUERIES = [
     "What is OpenSim?",
     "How do I install OpenSim?",
@@ -24,12 +27,15 @@ TEST_QUERIES = [
     "How do I use the OpenSim Python API?"
 ]
 
+# Shared session, so queries reuse keep-alive connections to the server
+session = requests.Session()
+
 def test_query(query):
     """Test a single query and return the result."""
     print(f"\nTesting query: '{query}'")
     
     try:
-        response = requests.post(
+        response = session.post(
             API_URL,
             json={"question": query},
             timeout=10
@@ -68,12 +74,12 @@ def evaluate_response(query, response):
     if context_length < 100:
         return f"Context too short ({context_length} chars)"
     
-    # Simple relevance check - see if query terms appear in context
-    query_terms = query.lower().split()
+    # Simple relevance check - see if query terms appear as words in context
+    query_terms = WORD_RE.findall(query.lower())
     query_terms = [term for term in query_terms if len(term) > 3]  # Filter out short words
     
-    context_lower = response["context"].lower()
-    matched_terms = [term for term in query_terms if term in context_lower]
+    context_words = set(WORD_RE.findall(response["context"].lower()))
+    matched_terms = [term for term in query_terms if term in context_words]
     
     relevance_score = len(matched_terms) / len(query_terms) if query_terms else 0
     
@@ -88,8 +94,11 @@ def main():
     
     results = {}
     
-    for query in TEST_QUERIES:
-        response = test_query(query)
+    # Send the queries concurrently; map returns responses in query order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        responses = list(executor.map(test_query, TEST_QUERIES))
+    
+    for query, response in zip(TEST_QUERIES, responses):
         evaluation = evaluate_response(query, response)
         
         results[query] = {
@@ -101,10 +110,7 @@ def main():
             "num_sources": len(response["sources"]) if response and "sources" in response else 0
         }
         
-        print(f"Evaluation: {evaluation}")
-        
-        # Add a delay between requests to avoid overwhelming the server
-        time.sleep(1)
+        print(f"Evaluation of '{query}': {evaluation}")
     
     # Print summary
     print("\n=== Test Summary ===")
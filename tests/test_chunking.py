@@ -0,0 +1,66 @@
+"""Tests for splitting text into sentence-aligned, overlapping chunks."""
+
+import importlib
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("tqdm")
+
+
+@pytest.fixture
+def create_chunks(tmp_path, monkeypatch):
+    # The script creates its data directories relative to the working directory
+    workdir = tmp_path / "scripts"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    return importlib.import_module("process_data_lightweight").create_chunks
+
+
+def test_short_text_is_one_chunk(create_chunks):
+    assert create_chunks("One sentence. Two.", chunk_size=100) == ["One sentence. Two."]
+
+
+def rfind_chunks(text, chunk_size, overlap, max_chunks):
+    """Reference chunker that rescans each window with str.rfind."""
+    if len(text) <= chunk_size:
+        return [text]
+    
+    chunks = []
+    start = 0
+    while start < len(text) and len(chunks) < max_chunks:
+        end = start + chunk_size
+        if end < len(text):
+            sentence_end = text.rfind('. ', start, end)
+            if sentence_end != -1:
+                end = sentence_end + 1
+        chunks.append(text[start:end])
+        start = end - overlap
+    return chunks
+
+
+def test_chunk_ends_at_last_sentence_boundary(create_chunks):
+    text = "Aaaa bbbb. Cccc dddd. Eeee ffff gggg hhhh hhhh hhhh."
+    
+    chunks = create_chunks(text, chunk_size=25, overlap=5)
+    
+    # The first chunk stops after the last ". " that fits in 25 characters
+    assert chunks[0] == "Aaaa bbbb. Cccc dddd."
+
+
+@pytest.mark.parametrize("text", [
+    "First sentence here. Second one is longer than that. Third. " * 20,
+    "No boundaries at all in this text " * 30,
+    "Ends exactly. " + "x" * 26 + ". tail " * 10,
+    "A. B. C. D. E. F. G. H. " * 15,
+])
+def test_bisect_matches_rfind_reference(create_chunks, text):
+    for chunk_size, overlap in [(50, 10), (64, 0), (120, 40)]:
+        assert create_chunks(text, chunk_size, overlap, 50) == rfind_chunks(text, chunk_size, overlap, 50)
+
+
+def test_max_chunks_limits_output(create_chunks):
+    chunks = create_chunks("word " * 200, chunk_size=20, overlap=5, max_chunks=3)
+    
+    assert len(chunks) == 3
@@ -0,0 +1,29 @@
+"""Tests for the code block formatter."""
+
+from code_formatter import CodeFormattingLLM, format_code_blocks
+
+
+def test_code_block_is_dedented_and_stripped():
+    text = "Example:\n```python\n\n    x = 1\n    if x:\n        y = 2\n\n```\nDone."
+    
+    assert format_code_blocks(text) == "Example:\n```python\nx = 1\nif x:\n    y = 2\n```\nDone."
+
+
+def test_missing_language_defaults_to_python():
+    assert format_code_blocks("```\nprint(1)\n```") == "```python\nprint(1)\n```"
+
+
+def test_text_without_code_blocks_is_unchanged():
+    text = "OpenSim is a musculoskeletal modeling tool."
+    
+    assert format_code_blocks(text) == text
+
+
+def test_formatting_llm_formats_base_response():
+    class BaseLLM:
+        def generate_response(self, query, context_chunks, max_length, deterministic=False, use_cache=True):
+            return "```\n    import opensim\n```"
+    
+    llm = CodeFormattingLLM(BaseLLM())
+    
+    assert llm.generate_response("query", []) == "```python\nimport opensim\n```"
@@ -0,0 +1,53 @@
+"""Tests for the static KV cache / attention implementation combination."""
+
+import types
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import llm_helper
+from llm_helper import MistralLLM
+
+
+class FakeStaticCache:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+def make_llm(attn_implementation):
+    """Build a MistralLLM without loading any weights."""
+    llm = MistralLLM.__new__(MistralLLM)
+    llm.attn_implementation = attn_implementation
+    llm.model = types.SimpleNamespace(config=object(), device="cpu")
+    return llm
+
+
+@pytest.mark.parametrize("attn_implementation", ["sdpa", "eager"])
+def test_static_cache_created_for_supported_attention(monkeypatch, attn_implementation):
+    monkeypatch.setattr(llm_helper, "StaticCache", FakeStaticCache)
+    
+    cache = make_llm(attn_implementation)._create_static_cache(dtype=None)
+    
+    assert isinstance(cache, FakeStaticCache)
+
+
+def test_static_cache_skipped_with_flash_attention_2(monkeypatch):
+    monkeypatch.setattr(llm_helper, "StaticCache", FakeStaticCache)
+    
+    llm = make_llm("flash_attention_2")
+    llm.cache = llm._create_static_cache(dtype=None)
+    
+    assert llm.cache is None
+
+
+def test_flash_attention_2_skips_compile(monkeypatch):
+    monkeypatch.setattr(llm_helper, "StaticCache", FakeStaticCache)
+    
+    llm = make_llm("flash_attention_2")
+    llm.cache = llm._create_static_cache(dtype=None)
+    forward = llm.model.forward = object()
+    llm._compile_model()
+    
+    assert llm.model.forward is forward
@@ -0,0 +1,44 @@
+"""Tests for the LRU cache with optional expiry."""
+
+import lru_cache
+from lru_cache import LRUCache
+
+
+def test_get_returns_default_for_missing_key():
+    cache = LRUCache(2)
+    
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("c", 3)
+    
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_put_replaces_existing_value():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("a", 2)
+    
+    assert cache.get("a") == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(lru_cache.time, "monotonic", lambda: now[0])
+    cache = LRUCache(2, ttl=10)
+    cache.put("a", 1)
+    
+    now[0] = 105.0
+    assert cache.get("a") == 1
+    
+    now[0] = 111.0
+    assert cache.get("a") is None
@@ -0,0 +1,48 @@
+"""Tests for metric-aware pruning of retrieval results."""
+
+from result_pruning import prune_results
+
+
+def ip_result(distance):
+    return {"distance": distance, "score": distance}
+
+
+def l2_result(distance):
+    return {"distance": distance, "score": 1.0 / (1.0 + distance)}
+
+
+def test_empty_results_are_returned_unchanged():
+    assert prune_results([], inner_product=True) == []
+
+
+def test_inner_product_keeps_hits_within_relative_margin():
+    results = [ip_result(0.8), ip_result(0.7), ip_result(0.6)]
+    
+    # Cutoff is 0.8 - 0.15 * 0.8 = 0.68
+    kept = prune_results(results, inner_product=True)
+    
+    assert [result["distance"] for result in kept] == [0.8, 0.7]
+
+
+def test_l2_keeps_hits_within_ratio_of_nearest():
+    results = [l2_result(0.4), l2_result(0.6), l2_result(0.7)]
+    
+    # Cutoff is 0.4 * 1.5 + 0.05 = 0.65
+    kept = prune_results(results, inner_product=False)
+    
+    assert [result["distance"] for result in kept] == [0.4, 0.6]
+
+
+def test_l2_exact_match_keeps_close_neighbors():
+    results = [l2_result(0.0), l2_result(0.04), l2_result(0.5)]
+    
+    kept = prune_results(results, inner_product=False)
+    
+    assert [result["distance"] for result in kept] == [0.0, 0.04]
+
+
+def test_min_score_and_max_chunks():
+    results = [ip_result(0.9), ip_result(0.85), ip_result(0.8)]
+    
+    assert len(prune_results(results, inner_product=True, min_score=0.82)) == 2
+    assert len(prune_results(results, inner_product=True, max_chunks=1)) == 1
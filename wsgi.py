@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+OpenSim RAG System - WSGI Entry Point
+
+This module exposes the Flask application for production WSGI servers.
+Run it under gunicorn with the models preloaded in the master process:
+
+    gunicorn -w 4 -k gthread --threads 8 --preload wsgi:app --bind 0.0.0.0:5100
+"""
+
+from app import app
+
+if __name__ == "__main__":
+    app.run(host='0.0.0.0', port=5100)